@@ -0,0 +1,134 @@
+"""작가 모델 요청 본문 구성 비용 벤치마크.
+
+예전 방식(매 라운드 messages 전체를 Gemini contents로 변환하고 aiohttp의 json=처럼 전체를
+json.dumps)과 GeminiConversation(새 turn만 직렬화해 덧붙임)을 라운드별로 비교합니다.
+대화는 Gemini 데이터셋의 실제 turn을 되풀이해 --rounds 라운드(작가 응답 + 전문가 응답)까지 늘립니다.
+
+라운드별로 본문 구성 시간(반복 측정의 중앙값)과 tracemalloc으로 잰 할당량(최대치)을 출력합니다.
+
+사용 예:
+    python bench_payload.py --rounds 30 --repeat 50
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+from gemini_conversation import GeminiConversation
+
+DEFAULT_DATASET_PATH = "Gemini-sft-09-07-val.jsonl"
+
+
+def legacy_request_body(messages: list[dict], temperature: float) -> bytes:
+    """예전 call_vertex_ai_endpoint의 변환 + aiohttp json= 직렬화와 같은 작업"""
+    contents = []
+    system_instruction = None
+    for msg in messages:
+        if msg["role"] == "system":
+            system_instruction = msg["content"]
+        elif msg["role"] == "user":
+            contents.append({"role": "user", "parts": [{"text": msg["content"]}]})
+        elif msg["role"] == "assistant":
+            contents.append({"role": "model", "parts": [{"text": msg["content"]}]})
+    payload = {"contents": contents, "generationConfig": {"temperature": temperature, "maxOutputTokens": 8192}}
+    if system_instruction:
+        payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+    return json.dumps(payload).encode("utf-8")
+
+
+def build_rounds(dataset_path: str, rounds: int) -> tuple[str, str, list[tuple[str, str]]]:
+    """가장 긴 샘플의 (시스템 프롬프트, 첫 user 프롬프트, 라운드별 (작가 응답, 전문가 응답))"""
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    record = max(records, key=lambda r: len(r.get("contents", [])))
+    system_prompt = record["systemInstruction"]["parts"][0]["text"]
+    turns = [c["parts"][0]["text"] for c in record["contents"] if c.get("parts") and "text" in c["parts"][0]]
+    user_prompt, rest = turns[0], turns[1:]
+    pairs = [(rest[i], rest[i + 1]) for i in range(0, len(rest) - 1, 2)]
+    return system_prompt, user_prompt, [pairs[i % len(pairs)] for i in range(rounds)]
+
+
+def _timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1e6
+
+
+def _peak_alloc(fn) -> int:
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(dataset_path: str, rounds: int, repeat: int, temperature: float = 0.8) -> list[dict]:
+    """라운드별 본문 구성 시간(중앙값, µs)과 최대 할당량(바이트)을 측정합니다.
+
+    같은 turn을 한 대화에 두 번 넣을 수 없으므로, 증분 방식은 대화 repeat개를 나란히 키우며
+    각 대화에 이번 라운드 turn을 한 번씩 추가하는 시간을 잽니다. (마지막 하나로 할당량 측정)
+    """
+    system_prompt, user_prompt, round_turns = build_rounds(dataset_path, rounds)
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+    conversations = [GeminiConversation(system_prompt, temperature) for _ in range(repeat + 1)]
+    for conversation in conversations:
+        conversation.append("user", user_prompt)
+
+    rows = []
+    for round_idx, (model_text, expert_text) in enumerate(round_turns, start=1):
+        messages.append({"role": "assistant", "content": model_text})
+        messages.append({"role": "user", "content": expert_text})
+        legacy_times = [_timed(lambda: legacy_request_body(messages, temperature)) for _ in range(repeat)]
+        legacy_peak = _peak_alloc(lambda: legacy_request_body(messages, temperature))
+
+        def _append_round(conversation):
+            conversation.append("assistant", model_text)
+            conversation.append("user", expert_text)
+            return conversation.body
+
+        incremental_times = [_timed(lambda: _append_round(c)) for c in conversations[:-1]]
+        incremental_peak = _peak_alloc(lambda: _append_round(conversations[-1]))
+
+        legacy_body = legacy_request_body(messages, temperature)
+        if json.loads(legacy_body) != conversations[-1].payload():
+            raise AssertionError(f"{round_idx}라운드 요청 본문이 예전 방식과 다릅니다.")
+        rows.append({
+            "round": round_idx,
+            "legacy_us": round(statistics.median(legacy_times), 1),
+            "legacy_alloc_kb": round(legacy_peak / 1024, 1),
+            "incremental_us": round(statistics.median(incremental_times), 1),
+            "incremental_alloc_kb": round(incremental_peak / 1024, 1),
+            "legacy_body_kb": round(len(legacy_body) / 1024, 1),
+            "body_kb": round(len(conversations[-1].body) / 1024, 1),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="작가 모델 요청 본문 구성 비용 벤치마크")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=50, help="라운드별 반복 측정 횟수")
+    parser.add_argument("--output", help="라운드별 결과를 저장할 JSON 경로")
+    args = parser.parse_args(argv)
+
+    rows = run(args.dataset, args.rounds, args.repeat)
+    print(f"{'라운드':>4} | {'예전(µs)':>9} {'할당(KB)':>9} | {'증분(µs)':>9} {'할당(KB)':>9} | {'본문 예전/증분(KB)':>18}")
+    for row in rows:
+        print(
+            f"{row['round']:>6} | {row['legacy_us']:>9} {row['legacy_alloc_kb']:>9} | "
+            f"{row['incremental_us']:>9} {row['incremental_alloc_kb']:>9} | "
+            f"{row['legacy_body_kb']:>8} / {row['body_kb']:<8}"
+        )
+    legacy_total = sum(r["legacy_us"] for r in rows)
+    incremental_total = sum(r["incremental_us"] for r in rows)
+    print(f"\n생성 1회 누적 본문 구성 시간: 예전 {legacy_total / 1000:.2f}ms → 증분 {incremental_total / 1000:.2f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""작가 모델(Vertex AI) 엔드포인트 풀: 상태 추적, 지연 시간 기반 선택, 장애 조치.
+
+같은 조정 모델을 여러 리전 / 프로젝트에 배포해 두고, 생성 1회를 시작할 때 엔드포인트
+하나를 골라(lease) 그 생성의 모든 라운드를 같은 엔드포인트로 보냅니다. 모델 동작을
+일관되게 유지하기 위해서이며, 호출이 재시도할 만한 오류(429, 5xx, 연결 실패)로
+실패했을 때만 다른 엔드포인트로 옮겨 그 라운드를 다시 보냅니다.
+
+선택 방식:
+- "latency": EWMA 지연 × (1 + 진행 중인 생성 수) / weight 가 가장 작은 엔드포인트
+- "least_loaded": 진행 중인 생성 수 / weight 가 가장 작은 엔드포인트 (같으면 EWMA 지연 순)
+아직 지연 기록이 없는 엔드포인트는 기록된 엔드포인트들 중 가장 빠른 값으로 간주해 한 번씩은 선택되게 합니다.
+
+상태 추적은 간단한 회로 차단기입니다. 연속 실패가 failure_threshold 이상이거나 할당량 초과
+(429)이면 cooldown_sec 동안 선택에서 제외하고, 그 뒤에는 다시 후보로 넣어 성공하면 복구합니다.
+모든 엔드포인트가 제외된 상태라면 가장 먼저 복구될 엔드포인트를 고릅니다.
+"""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+DEFAULT_LATENCY_SEC = 5.0
+QUOTA_EXCEEDED_STATUS = 429
+
+
+@dataclass(frozen=True)
+class VertexEndpoint:
+    endpoint_id: str
+    project_id: str
+    location: str
+    model_id: str = ""
+    weight: float = 1.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.project_id}/{self.location}/{self.endpoint_id}"
+
+    @property
+    def label(self) -> str:
+        """화면 표시용 짧은 이름"""
+        return f"{self.location} · …{self.endpoint_id[-6:]}"
+
+
+def load_endpoints(config) -> list[VertexEndpoint]:
+    """JSON 문자열 또는 dict 목록을 VertexEndpoint 목록으로 변환합니다."""
+    items = json.loads(config) if isinstance(config, str) else config
+    endpoints = [VertexEndpoint(**{**item, "weight": float(item.get("weight", 1.0))}) for item in items]
+    if not endpoints:
+        raise ValueError("엔드포인트가 하나 이상 필요합니다.")
+    return endpoints
+
+
+class _EndpointState:
+    def __init__(self):
+        self.ewma_latency = None
+        self.leases = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.last_error = ""
+
+
+class EndpointPool:
+    """여러 세션이 공유하는 스레드 안전 엔드포인트 풀"""
+
+    def __init__(self, endpoints: list[VertexEndpoint], strategy: str = "latency", ewma_alpha: float = 0.3,
+                 failure_threshold: int = 3, cooldown_sec: float = 30.0):
+        if strategy not in ("latency", "least_loaded"):
+            raise ValueError(f"알 수 없는 선택 방식: {strategy}")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+        self._states = {endpoint: _EndpointState() for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+
+    # --- 선택 ---
+    def _is_healthy(self, endpoint: VertexEndpoint, now: float) -> bool:
+        return self._states[endpoint].unhealthy_until <= now
+
+    def _score(self, endpoint: VertexEndpoint, default_latency: float) -> tuple:
+        state = self._states[endpoint]
+        latency = state.ewma_latency if state.ewma_latency is not None else default_latency
+        if self.strategy == "least_loaded":
+            return state.leases / endpoint.weight, latency
+        return latency * (1 + state.leases) / endpoint.weight, state.leases
+
+    def _pick(self, exclude=()) -> VertexEndpoint | None:
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if not candidates:
+            return None
+        healthy = [e for e in candidates if self._is_healthy(e, now)]
+        if not healthy:
+            # 모두 제외된 상태면 가장 먼저 복구될 엔드포인트를 사용
+            return min(candidates, key=lambda e: self._states[e].unhealthy_until)
+        known = [self._states[e].ewma_latency for e in healthy if self._states[e].ewma_latency is not None]
+        default_latency = min(known) if known else DEFAULT_LATENCY_SEC
+        scores = {e: self._score(e, default_latency) for e in healthy}
+        best = min(scores.values())
+        # 점수가 같은 엔드포인트끼리는 무작위로 나눠 한쪽으로 몰리지 않게 함
+        return random.choice([e for e in healthy if scores[e] == best])
+
+    def acquire(self) -> VertexEndpoint:
+        """생성 1회에 사용할 엔드포인트를 고르고 점유합니다. 끝나면 release를 호출하세요."""
+        with self._lock:
+            endpoint = self._pick()
+            self._states[endpoint].leases += 1
+            return endpoint
+
+    def release(self, endpoint: VertexEndpoint):
+        with self._lock:
+            state = self._states[endpoint]
+            state.leases = max(0, state.leases - 1)
+
+    def failover(self, current: VertexEndpoint, tried: set) -> VertexEndpoint | None:
+        """current(와 tried)를 제외한 엔드포인트로 점유를 옮깁니다. 옮길 곳이 없으면 None (점유 유지)"""
+        with self._lock:
+            endpoint = self._pick(exclude=tried | {current})
+            if endpoint is None:
+                return None
+            self._states[current].leases = max(0, self._states[current].leases - 1)
+            self._states[endpoint].leases += 1
+            return endpoint
+
+    # --- 상태 기록 ---
+    def record_success(self, endpoint: VertexEndpoint, latency: float):
+        with self._lock:
+            state = self._states[endpoint]
+            state.successes += 1
+            state.consecutive_failures = 0
+            state.unhealthy_until = 0.0
+            if state.ewma_latency is None:
+                state.ewma_latency = latency
+            else:
+                state.ewma_latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * state.ewma_latency
+
+    def record_failure(self, endpoint: VertexEndpoint, status: int | None, error: str = ""):
+        """재시도할 만한 실패(429, 5xx, 연결 실패 / 시간 초과)를 기록합니다."""
+        with self._lock:
+            state = self._states[endpoint]
+            state.failures += 1
+            state.consecutive_failures += 1
+            state.last_error = error[:200]
+            if status == QUOTA_EXCEEDED_STATUS or state.consecutive_failures >= self.failure_threshold:
+                state.unhealthy_until = time.monotonic() + self.cooldown_sec
+
+    def snapshot(self) -> list[dict]:
+        """대시보드용 엔드포인트별 상태"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "endpoint": endpoint.name,
+                "label": endpoint.label,
+                "healthy": self._is_healthy(endpoint, now),
+                "ewma_latency": self._states[endpoint].ewma_latency,
+                "leases": self._states[endpoint].leases,
+                "successes": self._states[endpoint].successes,
+                "failures": self._states[endpoint].failures,
+                "last_error": self._states[endpoint].last_error,
+            } for endpoint in self.endpoints]
+
+
+def is_retryable_status(status: int | None) -> bool:
+    """다른 엔드포인트로 다시 보낼 만한 실패인지 (None은 연결 실패 / 시간 초과)"""
+    return status is None or status == QUOTA_EXCEEDED_STATUS or status >= 500
+
+
+class EndpointLease:
+    """생성 1회가 점유한 엔드포인트. 장애 조치로 옮겨 다녀도 점유는 하나만 유지합니다."""
+
+    def __init__(self, pool: EndpointPool):
+        self.pool = pool
+        self.endpoint = pool.acquire()
+        self._released = False
+
+    def failover(self, tried: set) -> bool:
+        """tried(이번 요청에서 이미 실패한 엔드포인트)가 아닌 다른 엔드포인트로 옮깁니다. 옮겼으면 True"""
+        endpoint = self.pool.failover(self.endpoint, tried)
+        if endpoint is None:
+            return False
+        self.endpoint = endpoint
+        return True
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.pool.release(self.endpoint)
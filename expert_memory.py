@@ -0,0 +1,264 @@
+"""전문가 질의/응답 재사용을 위한 문자 n-gram TF-IDF 유사도 색인.
+
+데이터셋에 기록된 전문가 질의/응답 쌍(GPT 형식의 tool 메시지, Gemini 형식의 번갈아 오는
+user 메시지)과 실행 중 새로 받은 응답을 색인해 두고, 새 질의가 기존 질의와 충분히
+비슷하면(코사인 유사도 ≥ threshold) 전문가 모델을 호출하지 않고 저장된 응답을 돌려줍니다.
+
+질의는 공백을 뺀 문자 bigram/trigram을 64비트 정수 코드로 바꾼 뒤, 부분 선형 TF
+(1 + log tf)와 IDF를 곱한 벡터로 표현합니다. 색인은 n-gram 코드 순으로 정렬된 게시 목록
+(CSR 형태)이며, 질의에 나온 n-gram의 게시 목록만 모아 np.bincount로 문서별 내적을 구합니다.
+문서가 추가되면 IDF가 바뀌므로 다음 조회 때 게시 목록을 한 번에 다시 만듭니다.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from ksat_dataset import iter_samples
+
+NGRAM_SIZES = (2, 3)
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_LIVE_PAIRS = 2000
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+
+def question_terms(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """질의의 (정렬된 n-gram 코드, 부분 선형 TF 가중치)를 반환합니다."""
+    compact = _WHITESPACE_PATTERN.sub("", text.lower())
+    points = np.frombuffer(compact.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    chunks = []
+    for n in NGRAM_SIZES:
+        if len(points) < n:
+            continue
+        codes = points[:len(points) - n + 1].copy()
+        for offset in range(1, n):
+            codes = (codes << np.uint64(21)) | points[offset:len(points) - n + 1 + offset]
+        chunks.append(codes)
+    # 두 글자 미만의 질의는 글자 자체를 사용
+    codes = np.concatenate(chunks) if chunks else points
+    unique, counts = np.unique(codes, return_counts=True)
+    return unique, 1.0 + np.log(counts)
+
+
+@dataclass
+class ExpertMatch:
+    question: str
+    answer: str
+    similarity: float
+    source: str
+
+
+class ExpertAnswerIndex:
+    """전문가 질의/응답 쌍의 TF-IDF 유사도 색인 (여러 세션이 공유하는 스레드 안전 객체)
+
+    persist_path를 주면 실행 중 추가된 응답을 JSONL로 덧붙여 두고, load_persisted로 다시 읽습니다.
+    파일이 메모리에 남는 쌍(max_live_pairs)보다 많이 쌓이면 남아 있는 쌍만으로 다시 씁니다.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_live_pairs: int = DEFAULT_MAX_LIVE_PAIRS,
+                 persist_path: str | None = None):
+        self.threshold = threshold
+        self.persist_path = persist_path
+        self._historical = []                       # 데이터셋에서 읽은 쌍
+        self._live = deque(maxlen=max_live_pairs)   # 실행 중 추가된 쌍 (오래된 것부터 버림)
+        self._known = set()                         # 정규화된 질의 (중복 색인 방지)
+        self._persisted_lines = 0                   # persist_path 파일의 줄 수
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._built = None
+
+        # 조회 통계
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+        self.expert_calls = 0
+        self.expert_seconds = 0.0
+
+    # --- 색인 구성 ---
+    def _add(self, question: str, answer: str, source: str) -> bool:
+        key = _normalize(question)
+        if not key or not answer or key in self._known:
+            return False
+        self._known.add(key)
+        codes, tf = question_terms(question)
+        doc = (question, answer, source, codes, tf)
+        if source == "live":
+            if self._live.maxlen and len(self._live) == self._live.maxlen:
+                self._known.discard(_normalize(self._live[0][0]))
+            self._live.append(doc)
+        else:
+            self._historical.append(doc)
+        self._dirty = True
+        return True
+
+    def load_datasets(self, paths: list[str]) -> int:
+        """데이터셋 파일들의 전문가 질의/응답 쌍을 색인에 추가하고 추가된 개수를 반환합니다."""
+        added = 0
+        with self._lock:
+            for path in paths:
+                source = os.path.basename(path)
+                for _, sample in iter_samples(path):
+                    for question, answer in sample.expert_pairs:
+                        added += self._add(question, answer, source)
+        return added
+
+    def load_persisted(self) -> int:
+        """이전 실행에서 저장한 응답을 다시 읽어 추가하고 추가된 개수를 반환합니다."""
+        added = 0
+        if not (self.persist_path and os.path.exists(self.persist_path)):
+            return added
+        with self._lock:
+            lines = 0
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        item = json.loads(line)
+                        added += self._add(item["question"], item["answer"], "live")
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue
+            self._persisted_lines = lines
+            # 밀려난 쌍, 중복, 깨진 줄이 있으면 남은 쌍만으로 파일을 다시 씀
+            if lines > len(self._live):
+                self._compact()
+        return added
+
+    def add(self, question: str, answer: str) -> bool:
+        """실행 중 받은 전문가 응답을 색인에 추가합니다."""
+        with self._lock:
+            added = self._add(question, answer, "live")
+            if added and self.persist_path:
+                try:
+                    os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+                    with open(self.persist_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"question": question, "answer": answer}, ensure_ascii=False) + "\n")
+                    self._persisted_lines += 1
+                except OSError:
+                    pass
+                # 파일이 메모리에 남는 쌍의 두 배를 넘으면 정리 (매번 다시 쓰지 않도록 여유를 둠)
+                if self._live.maxlen and self._persisted_lines > 2 * self._live.maxlen:
+                    self._compact()
+        return added
+
+    def _compact(self):
+        """persist_path 파일을 메모리에 남아 있는 실행 중 쌍만으로 다시 씁니다. (임시 파일로 쓴 뒤 교체)"""
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for question, answer, *_ in self._live:
+                    f.write(json.dumps({"question": question, "answer": answer}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.persist_path)
+            self._persisted_lines = len(self._live)
+        except OSError:
+            pass
+
+    def _build(self):
+        docs = self._historical + list(self._live)
+        if not docs:
+            self._built = None
+            self._dirty = False
+            return
+        lengths = np.array([len(doc[3]) for doc in docs])
+        codes = np.concatenate([doc[3] for doc in docs])
+        tf = np.concatenate([doc[4] for doc in docs])
+        doc_ids = np.repeat(np.arange(len(docs)), lengths)
+
+        # n-gram 코드 순으로 정렬한 게시 목록 (문서 안에서 코드는 이미 유일)
+        order = np.argsort(codes, kind="stable")
+        codes, tf, doc_ids = codes[order], tf[order], doc_ids[order]
+        vocab, starts, df = np.unique(codes, return_index=True, return_counts=True)
+        idf = np.log((1 + len(docs)) / (1 + df)) + 1.0
+        weights = tf * np.repeat(idf, df)
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights ** 2, minlength=len(docs)))
+
+        self._built = {
+            "docs": docs,
+            "vocab": vocab,
+            "starts": starts,
+            "df": df,
+            "idf": idf,
+            "doc_ids": doc_ids,
+            "weights": weights,
+            "norms": norms,
+            "unseen_idf": np.log(1 + len(docs)) + 1.0,
+        }
+        self._dirty = False
+
+    # --- 조회 ---
+    def _search(self, question: str) -> ExpertMatch | None:
+        if self._dirty:
+            self._build()
+        built = self._built
+        if built is None:
+            return None
+
+        codes, tf = question_terms(question)
+        if not len(codes):
+            return None
+        pos = np.searchsorted(built["vocab"], codes)
+        pos[pos == len(built["vocab"])] = 0
+        found = built["vocab"][pos] == codes
+
+        # 색인에 없는 n-gram도 질의 벡터의 길이에는 반영
+        query_weights = tf * np.where(found, built["idf"][pos], built["unseen_idf"])
+        query_norm = np.sqrt(np.sum(query_weights ** 2))
+        pos, query_weights = pos[found], query_weights[found]
+        if not len(pos):
+            return None
+
+        # 질의 n-gram들의 게시 목록 구간을 한 번에 모음
+        starts = built["starts"][pos]
+        counts = built["df"][pos]
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        dots = np.bincount(
+            built["doc_ids"][offsets],
+            weights=built["weights"][offsets] * np.repeat(query_weights, counts),
+            minlength=len(built["docs"]),
+        )
+        similarity = dots / (built["norms"] * query_norm)
+        best = int(np.argmax(similarity))
+        question_text, answer, source, _, _ = built["docs"][best]
+        return ExpertMatch(question_text, answer, float(similarity[best]), source)
+
+    def lookup(self, question: str) -> ExpertMatch | None:
+        """유사도가 임계값 이상인 저장된 응답을 반환합니다. 없으면 None (호출자가 전문가 모델 호출)"""
+        started = time.perf_counter()
+        with self._lock:
+            match = self._search(question)
+            hit = match is not None and match.similarity >= self.threshold
+            self.lookups += 1
+            self.hits += hit
+            self.lookup_seconds += time.perf_counter() - started
+        return match if hit else None
+
+    def observe_expert_call(self, latency: float):
+        """전문가 모델을 실제로 호출한 경우의 소요 시간을 기록합니다. (절약 시간 추정용)"""
+        with self._lock:
+            self.expert_calls += 1
+            self.expert_seconds += latency
+
+    def stats(self) -> dict:
+        """적중률과 절약 시간(적중 수 × 실제 전문가 호출 평균 지연 − 조회 시간)"""
+        with self._lock:
+            avg_expert_latency = self.expert_seconds / self.expert_calls if self.expert_calls else 0.0
+            return {
+                "pairs": len(self._historical) + len(self._live),
+                "historical_pairs": len(self._historical),
+                "live_pairs": len(self._live),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "avg_lookup_ms": self.lookup_seconds / self.lookups * 1000 if self.lookups else 0.0,
+                "avg_expert_latency": avg_expert_latency,
+                "latency_saved_sec": max(0.0, self.hits * avg_expert_latency - self.lookup_seconds),
+            }
@@ -0,0 +1,86 @@
+"""라운드마다 이어 붙여 만드는 Vertex AI(Gemini) generateContent 요청 본문.
+
+작가 모델과의 대화는 라운드마다 길어지는데, 매 호출마다 OpenAI 형식 messages 전체를
+Gemini 형식 contents로 다시 변환하고 JSON 전체를 다시 직렬화하면 라운드당 CPU 시간과
+메모리 할당이 대화 길이에 비례해 늘어납니다.
+
+GeminiConversation은 변환한 turn과 그 직렬화 바이트를 보관하고, 새 turn만 직렬화해
+요청 본문 버퍼 끝에 덧붙입니다. 본문은 생성 설정과 시스템 지시문을 앞에, contents 배열을
+맨 뒤에 두어 `]}` 두 바이트만 떼었다 붙이면 되도록 구성합니다.
+"""
+import json
+
+# OpenAI 형식 역할 → Gemini 형식 역할 (system은 systemInstruction으로 따로 보냄)
+GEMINI_ROLES = {"user": "user", "assistant": "model"}
+DEFAULT_MAX_OUTPUT_TOKENS = 8192
+
+_CLOSING = b"]}"
+
+
+def _dumps(value) -> bytes:
+    # 한국어 본문을 \uXXXX로 늘리지 않도록 ensure_ascii=False (UTF-8 3바이트 vs 6바이트)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class GeminiConversation:
+    """Gemini 형식으로 변환된 대화와 직렬화된 요청 본문을 함께 유지합니다."""
+
+    def __init__(self, system_prompt: str = "", temperature: float = 0.7,
+                 max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS):
+        self.system_prompt = system_prompt
+        self.temperature = temperature
+        self.messages = []   # 원래 형식(OpenAI 스타일) 메시지
+        self.contents = []   # Gemini 형식 turn
+
+        header = {"generationConfig": {"temperature": temperature, "maxOutputTokens": max_output_tokens}}
+        if system_prompt:
+            header["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+        # {"generationConfig":...,"systemInstruction":...,"contents":[ ... ]}
+        self._body = bytearray(_dumps(header)[:-1] + b',"contents":[' + _CLOSING)
+
+    @classmethod
+    def from_messages(cls, messages: list[dict], temperature: float = 0.7,
+                      max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS) -> "GeminiConversation":
+        """OpenAI 형식 messages 목록으로 대화를 만듭니다. (system 메시지가 여럿이면 마지막 것을 사용)"""
+        system_prompt = ""
+        for msg in messages:
+            if msg["role"] == "system":
+                system_prompt = msg["content"]
+        conversation = cls(system_prompt, temperature, max_output_tokens)
+        for msg in messages:
+            if msg["role"] != "system":
+                conversation.append(msg["role"], msg["content"])
+        return conversation
+
+    def append(self, role: str, text: str):
+        """turn 하나를 추가합니다. 새 turn만 직렬화하므로 비용은 대화 길이와 무관합니다."""
+        self.messages.append({"role": role, "content": text})
+        gemini_role = GEMINI_ROLES.get(role)
+        if gemini_role is None:
+            return
+        turn = {"role": gemini_role, "parts": [{"text": text}]}
+        del self._body[-len(_CLOSING):]
+        if self.contents:
+            self._body += b","
+        self._body += _dumps(turn)
+        self._body += _CLOSING
+        self.contents.append(turn)
+
+    @property
+    def body(self) -> bytearray:
+        """직렬화된 요청 본문. 복사하지 않고 내부 버퍼를 그대로 돌려주므로 전송이 끝나기 전에 append하지 마세요."""
+        return self._body
+
+    def payload(self) -> dict:
+        """요청 본문을 dict로 반환합니다. (디버깅 / 검증용)"""
+        return json.loads(self._body)
+
+    def last_text(self, role: str = "assistant") -> str:
+        """해당 역할의 마지막 비어 있지 않은 메시지"""
+        for msg in reversed(self.messages):
+            if msg["role"] == role and msg["content"]:
+                return msg["content"]
+        return ""
+
+    def __len__(self) -> int:
+        return len(self.contents)
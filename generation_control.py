@@ -0,0 +1,223 @@
+"""지문 생성 실행 제어 도우미.
+
+RoundController는 작가 모델의 라운드 진행 상황을 보고 계속 / 최종 지문 요청 / 중단을
+결정합니다. 빈 응답, 같은 내용의 반복, 이미 한 전문가 질의의 반복처럼 진전이 없는
+라운드가 이어지거나 라운드 / 토큰 예산이 바닥나면, 먼저 최종 지문을 한 번 요청하고
+그래도 지문이 나오지 않으면 중단합니다.
+
+Streamlit은 세션마다 asyncio.run으로 별도의 이벤트 루프를 만들기 때문에
+asyncio.Semaphore로는 세션 간 동시 호출 수를 제한할 수 없습니다.
+SlotLimiter는 스레드 잠금으로 슬롯을 관리하고, 대기는 asyncio.sleep으로 하여
+대기 중이든 호출 중이든 작업이 취소되면 즉시 슬롯을 돌려줍니다.
+"""
+import asyncio
+import re
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+
+class SlotLimiter:
+    """여러 이벤트 루프에서 공유하는 동시 호출 수 제한기"""
+
+    def __init__(self, capacity: int, poll_interval: float = 0.05):
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._in_use >= self.capacity:
+                return False
+            self._in_use += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_use = max(0, self._in_use - 1)
+
+    @asynccontextmanager
+    async def slot(self):
+        """슬롯 하나를 점유합니다. 취소(CancelledError)되어도 슬롯은 반드시 반환됩니다."""
+        while not self.try_acquire():
+            await asyncio.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class GenerationTimeout(Exception):
+    """생성 마감 시간을 넘긴 경우"""
+
+
+async def iterate_with_deadline(agen, timeout: float, heartbeat: float, on_heartbeat=None):
+    """비동기 제너레이터를 별도 태스크에서 돌리며 이벤트를 전달합니다.
+
+    이벤트가 없는 동안에도 heartbeat 초마다 on_heartbeat를 호출하므로, 호출자가
+    그 안에서 중지 요청을 확인할 수 있습니다. 마감 시간을 넘기면 GenerationTimeout을
+    발생시키고, 어떤 이유로든 반복이 끝나면 생산 태스크(진행 중인 네트워크 호출 포함)를
+    취소합니다. 중간에 break할 수 있으므로 contextlib.aclosing과 함께 사용하세요.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    queue = asyncio.Queue()
+    done = object()
+
+    async def _produce():
+        try:
+            async for item in agen:
+                queue.put_nowait(item)
+        finally:
+            queue.put_nowait(done)
+
+    producer = asyncio.create_task(_produce())
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise GenerationTimeout(f"{timeout:.0f}초 안에 생성이 끝나지 않았습니다.")
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                if on_heartbeat:
+                    on_heartbeat()
+                continue
+            if item is done:
+                break
+            yield item
+        if producer.done() and not producer.cancelled() and producer.exception():
+            raise producer.exception()
+    finally:
+        if not producer.done():
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+# 종료 사유 코드 → 화면 표시용 문구
+END_REASON_LABELS = {
+    "passage": "지문 완성",
+    "forced_passage": "지문 완성 (최종 지문 요청 후)",
+    "max_rounds": "라운드 예산 소진",
+    "token_budget": "토큰 예산 소진",
+    "stalled": "진전 없는 라운드 반복",
+    "model_error": "모델 오류",
+    "error": "오류",
+    "cancelled": "사용자 중지",
+    "deadline": "마감 시간 초과",
+}
+
+# 진전이 없을 때 작가 모델에게 보내는 최종 지문 요청
+FINAL_PASSAGE_REQUEST = (
+    "지금까지 수집한 정보만으로 충분합니다. 더 이상 전문가에게 질의하지 말고, "
+    "최종 지문을 <passage></passage> 태그 안에 작성해 주세요."
+)
+
+_NORMALIZE_PATTERN = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _NORMALIZE_PATTERN.sub(" ", text).strip().lower()
+
+
+@dataclass
+class RoundBudget:
+    max_rounds: int = 30
+    # 작가 + 전문가 호출의 누적 토큰 상한 (0이면 제한 없음)
+    max_total_tokens: int = 0
+    # 연속으로 허용할 진전 없는 라운드 수
+    max_stalled_rounds: int = 2
+
+
+class RoundController:
+    """라운드별 진전 여부를 추적해 계속 / 최종 지문 요청 / 중단을 결정합니다."""
+
+    def __init__(self, budget: RoundBudget):
+        self.budget = budget
+        self.rounds = 0
+        self.total_tokens = 0
+        self.stalled_rounds = 0
+        self.final_requested = False
+        self.end_reason = None
+        self._seen_texts = set()
+        self._expert_answers = {}  # 정규화된 질의 → 이전 응답
+
+    def start_round(self) -> bool:
+        """다음 라운드를 시작할 수 있으면 True, 예산이 바닥났으면 종료 사유를 기록하고 False"""
+        if self.rounds >= self.budget.max_rounds:
+            self.end_reason = self.end_reason or "max_rounds"
+            return False
+        if self.budget.max_total_tokens and self.total_tokens >= self.budget.max_total_tokens:
+            self.end_reason = self.end_reason or "token_budget"
+            return False
+        self.rounds += 1
+        return True
+
+    def add_usage(self, usage: dict):
+        self.total_tokens += usage.get("total_tokens", 0)
+
+    def cached_expert_answer(self, question: str) -> str | None:
+        """이번 생성에서 이미 같은 질의를 했다면 그때의 응답을 반환합니다."""
+        return self._expert_answers.get(_normalize(question))
+
+    def remember_expert_answer(self, question: str, answer: str):
+        self._expert_answers[_normalize(question)] = answer
+
+    def observe_round(self, text: str, new_expert_calls: int) -> str:
+        """라운드 결과(지문이 없는 경우)를 반영하고 다음 행동을 반환합니다.
+
+        Returns:
+            "continue": 다음 라운드 진행
+            "request_final": 최종 지문 요청 메시지를 추가한 뒤 다음 라운드 진행
+            "stop": 더 진행하지 않음 (end_reason 설정됨)
+        """
+        normalized = _normalize(text)
+        repeated = not normalized or normalized in self._seen_texts
+        self._seen_texts.add(normalized)
+
+        # 새로운 전문가 질의가 있고 같은 내용의 반복이 아니면 진전이 있는 라운드
+        if new_expert_calls and not repeated:
+            self.stalled_rounds = 0
+        else:
+            self.stalled_rounds += 1
+
+        if self.final_requested:
+            # 최종 지문을 요청했는데도 진전이 없으면 중단
+            if self.stalled_rounds >= 1 or self._budget_exhausted_after_next():
+                self.end_reason = self.end_reason or "stalled"
+                return "stop"
+            return "continue"
+
+        if self.stalled_rounds >= self.budget.max_stalled_rounds:
+            self.end_reason = "stalled"
+            return self._request_final()
+        if self._budget_exhausted_after_next():
+            # 마지막 한 라운드는 최종 지문 작성에 사용
+            if self.rounds + 1 >= self.budget.max_rounds:
+                self.end_reason = "max_rounds"
+            else:
+                self.end_reason = "token_budget"
+            return self._request_final()
+        return "continue"
+
+    def finish_with_passage(self):
+        self.end_reason = "forced_passage" if self.final_requested else "passage"
+
+    def _request_final(self) -> str:
+        self.final_requested = True
+        self.stalled_rounds = 0
+        return "request_final"
+
+    def _budget_exhausted_after_next(self) -> bool:
+        if self.rounds + 1 >= self.budget.max_rounds:
+            return True
+        if self.budget.max_total_tokens and self.rounds:
+            # 지금까지의 라운드당 평균 토큰으로 다음 라운드 이후 예산 초과 여부를 추정
+            projected = self.total_tokens + 2 * self.total_tokens / self.rounds
+            return projected >= self.budget.max_total_tokens
+        return False
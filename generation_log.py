@@ -0,0 +1,121 @@
+"""큐 기반 비동기 로깅과 구조화된 생성 로그(JSONL).
+
+렌더링 경로에서는 로그 레코드를 큐에 넣기만 하고, 포맷팅(JSON 직렬화)과 파일/stderr
+쓰기는 QueueListener 스레드가 맡습니다. 큐가 가득 차면 렌더링을 막는 대신 레코드를
+버리고 개수만 셉니다. (버려진 개수는 생성 레코드의 dropped_log_records에 함께 기록)
+
+생성 1회당 JSON 한 줄이 크기 기준으로 교체되는 파일(generations.jsonl)에 기록되고,
+교체된 파일은 gzip으로 압축됩니다. 레코드 필드(user_prompt, final_passage, model,
+dataset_index)는 score_passages.py 입력 형식과 같으므로 로그를 바로 채점할 수 있습니다.
+"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+
+GENERATION_LOGGER_NAME = "KSAT_Model_Preview.generations"
+QUEUE_MAX_SIZE = 10_000
+
+_listener = None
+_queue_handler = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """큐가 가득 차면 기다리지 않고 레코드를 버리는 QueueHandler"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """record.payload(dict)를 JSON 한 줄로 직렬화합니다. (리스너 스레드에서 실행)"""
+
+    def format(self, record):
+        payload = getattr(record, "payload", None)
+        if payload is None:
+            payload = {"message": record.getMessage()}
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _generation_file_handler(log_dir: str, max_bytes: int, backup_count: int) -> logging.Handler:
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, "generations.jsonl"),
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding="utf-8",
+    )
+    file_handler.rotator = _gzip_rotator
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.setFormatter(JsonLinesFormatter())
+    # 생성 로그 레코드만 파일로 보냄
+    file_handler.addFilter(lambda record: record.name == GENERATION_LOGGER_NAME)
+    return file_handler
+
+
+def configure_logging(log_dir: str, max_bytes: int, backup_count: int):
+    """루트 로거와 생성 로그를 큐 기반으로 구성합니다. 프로세스당 한 번만 적용됩니다.
+
+    이미 루트 로거에 달린 핸들러(stderr 등)는 리스너 쪽으로 옮겨져 그대로 동작합니다.
+    log_dir에 쓸 수 없으면 생성 로그 파일 없이 콘솔 로그만 구성합니다.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    file_handlers = []
+    try:
+        file_handlers.append(_generation_file_handler(log_dir, max_bytes, backup_count))
+    except OSError as e:
+        # 쓰기 권한이 없는 디렉터리 등: 생성 로그 파일 없이 콘솔 로그만 큐로 보냄
+        logging.getLogger(__name__).warning(f"생성 로그 파일을 열 수 없어 파일 기록 없이 진행합니다: {e}")
+
+    root = logging.getLogger()
+    console_handlers = list(root.handlers)
+    for handler in console_handlers:
+        root.removeHandler(handler)
+        # 생성 로그(JSON 전문)는 stderr로 내보내지 않음
+        handler.addFilter(lambda record: record.name != GENERATION_LOGGER_NAME)
+
+    _queue_handler = DroppingQueueHandler(queue.Queue(QUEUE_MAX_SIZE))
+    root.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(
+        _queue_handler.queue, *file_handlers, *console_handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def dropped_records() -> int:
+    """큐가 가득 차서 버려진 로그 레코드 수 (프로세스 시작 이후 누적)"""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def log_generation(record: dict, reasoning: list[str], reasoning_sample_rate: float):
+    """생성 1회의 구조화된 레코드를 기록합니다. 사고 과정 원문은 표본으로만 남깁니다."""
+    sampled = bool(reasoning) and random.random() < reasoning_sample_rate
+    payload = dict(record)
+    payload["reasoning_sampled"] = sampled
+    # 이 값이 이전 레코드보다 커졌다면 그 사이 레코드 일부가 빠져 있음
+    payload["dropped_log_records"] = dropped_records()
+    if sampled:
+        payload["reasoning"] = reasoning
+    logging.getLogger(GENERATION_LOGGER_NAME).info("generation", extra={"payload": payload})
@@ -0,0 +1,149 @@
+"""KSAT 지문 생성 데이터셋(JSONL) 파싱 도우미.
+
+Gemini SFT 형식(systemInstruction / contents)과 OpenAI SFT 형식(messages / tool_calls)의
+레코드를 같은 구조(Sample)로 정규화합니다. Streamlit에 의존하지 않으므로
+오프라인 스크립트에서도 그대로 가져다 쓸 수 있습니다.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+
+EXPERT_TAG_PATTERN = re.compile(r'<(?:expert|expertcall)>(.*?)</(?:expert|expertcall)>', re.DOTALL)
+
+
+@dataclass
+class Sample:
+    """데이터셋 한 줄(한 번의 지문 생성 과정)을 정규화한 결과"""
+    system_prompt: str = ""
+    user_prompt: str = ""
+    expected_response: str = ""
+    # (전문가 질의, 전문가 응답) 쌍 목록
+    expert_pairs: list[tuple[str, str]] = field(default_factory=list)
+
+
+def extract_passage(text: str) -> str:
+    """모델 응답에서 <passage> 내용 또는 </think> 이후 내용을 추출합니다."""
+    if "<passage>" in text and "</passage>" in text:
+        start = text.find("<passage>") + len("<passage>")
+        end = text.find("</passage>")
+        return text[start:end].strip()
+    if "</think>" in text:
+        return text.split("</think>", 1)[1].strip()
+    return text.strip()
+
+
+def _unwrap_expert_result(text: str) -> str:
+    """Gemini 형식의 전문가 응답({"result": ...})을 본문 문자열로 풀어냅니다."""
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        try:
+            data = json.loads(stripped)
+            if isinstance(data, dict) and "result" in data:
+                return str(data["result"])
+        except json.JSONDecodeError:
+            pass
+    return stripped
+
+
+def _parse_gemini_record(data: dict) -> Sample:
+    sample = Sample()
+
+    system_instruction = data.get("systemInstruction")
+    if isinstance(system_instruction, dict) and system_instruction.get("parts"):
+        sample.system_prompt = system_instruction["parts"][0].get("text", "")
+
+    pending_questions = []
+    last_model_text = ""
+    for content in data.get("contents", []):
+        role = content.get("role", "")
+        parts = content.get("parts", [])
+        if not parts or "text" not in parts[0]:
+            continue
+        text = parts[0]["text"]
+
+        if role == "user":
+            if not sample.user_prompt:  # 첫 번째 user 메시지가 입력 프롬프트
+                sample.user_prompt = text
+            elif pending_questions:
+                # 이후 user 메시지는 직전 전문가 질의에 대한 응답
+                sample.expert_pairs.append((pending_questions.pop(0), _unwrap_expert_result(text)))
+        elif role == "model":
+            last_model_text = text
+            pending_questions.extend(q.strip() for q in EXPERT_TAG_PATTERN.findall(text))
+
+    if last_model_text:
+        sample.expected_response = extract_passage(last_model_text)
+    return sample
+
+
+def _parse_openai_record(data: dict) -> Sample:
+    sample = Sample()
+
+    questions_by_call_id = {}
+    last_assistant_text = ""
+    for msg in data.get("messages", []):
+        role = msg.get("role", "")
+        text = msg.get("content") or ""
+
+        if role == "system" and not sample.system_prompt:
+            sample.system_prompt = text
+        elif role == "user" and not sample.user_prompt:
+            sample.user_prompt = text
+        elif role == "assistant":
+            if text:
+                last_assistant_text = text
+            for call in msg.get("tool_calls") or []:
+                try:
+                    arguments = json.loads(call["function"]["arguments"])
+                    questions_by_call_id[call["id"]] = str(arguments.get("input", "")).strip()
+                except (KeyError, TypeError, json.JSONDecodeError):
+                    continue
+        elif role == "tool":
+            question = questions_by_call_id.pop(msg.get("tool_call_id"), None)
+            if question:
+                sample.expert_pairs.append((question, text.strip()))
+
+    if last_assistant_text:
+        sample.expected_response = extract_passage(last_assistant_text)
+    return sample
+
+
+def parse_prompt_structure(user_prompt: str) -> tuple[str, str, str]:
+    """사용자 프롬프트를 파싱하여 분야, 유형, 주제를 추출합니다."""
+    try:
+        lines = user_prompt.strip().split('\n')
+        field_info = ""
+        type_info = ""
+        topic_info = ""
+        
+        for line in lines:
+            line = line.strip()
+            if line.startswith("분야:"):
+                field_info = line.replace("분야:", "").strip()
+            elif line.startswith("유형:"):
+                type_info = line.replace("유형:", "").strip()
+            elif line.startswith("주제:"):
+                topic_info = line.replace("주제:", "").strip()
+        
+        return field_info, type_info, topic_info
+    except Exception:
+        return "파싱 실패", "파싱 실패", "파싱 실패"
+
+
+def parse_record(data: dict) -> Sample:
+    """JSONL 한 줄을 형식에 맞게 파싱합니다. (Gemini / OpenAI SFT 형식 자동 판별)"""
+    if "messages" in data:
+        return _parse_openai_record(data)
+    return _parse_gemini_record(data)
+
+
+def parse_line(line: str) -> Sample:
+    return parse_record(json.loads(line))
+
+
+def iter_samples(path: str):
+    """(줄 번호, Sample)을 순서대로 생성합니다. 빈 줄은 건너뜁니다."""
+    with open(path, "r", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if line.strip():
+                yield index, parse_line(line)
@@ -0,0 +1,443 @@
+"""streamlit_viewer.py 동시 세션 부하 테스트.
+
+로컬 모의 서버(Vertex generateContent / Gemini OpenAI 호환 chat.completions / 비교 모드의
+OpenAI 조정 모델 chat.completions)를 띄우고,
+Streamlit AppTest로 실제 스크립트를 여러 세션에서 동시에 실행합니다. 각 세션은
+Preset 탐색(샘플 선택, 키워드 검색), Custom 입력, 지문 생성(비교 모드 포함)을 섞어 수행합니다.
+
+동시 세션 수 단계별로 다음을 보고하고, SLO를 만족하는 최대 동시 세션 수를 수용 가능
+용량으로 제시합니다.
+- 상호작용(재실행)별 지연 시간 p50 / p95 / p99
+- 지문 생성 지연 시간 p50 / p95 / p99 (비교 모드에서는 두 작가 모델이 모두 끝날 때까지)
+- 세션당 CPU 시간, 세션당 메모리(RSS 증가분)
+
+AppTest는 브라우저 왕복과 웹소켓 전송을 포함하지 않으므로, 실제 서버보다 약간
+낙관적인 수치가 나옵니다. 여러 세션을 동시에 돌리기 위해 Streamlit 내부 구현을 바꿔
+끼우므로, 확인된 버전(requirements.txt의 streamlit 고정 버전)에서만 실행됩니다.
+
+모의 서버는 별도 프로세스에서 돌아가므로 CPU 시간에 포함되지 않습니다. 세션당 CPU 시간은
+이 프로세스 전체(스크립트 실행 스레드와 앱의 네트워크 풀 / 로그 스레드 포함)의 값입니다.
+생성 로그와 검색 색인 / 전문가 응답 파일은 임시 디렉터리에 쓰므로 앱의 logs/, .cache/에는
+모의 데이터가 남지 않습니다.
+전문가 응답 재사용(EXPERT_MEMORY_THRESHOLD)은 꺼 두므로, 생성 시간에는 매번 전문가 호출과
+전문가 동시 호출 제한이 포함됩니다.
+
+사용 예:
+    python load_test.py --levels 1,4,8,16 --interactions 6 --writer-latency 1.0
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_viewer.py")
+SEARCH_KEYWORDS = ["채권", "의식", "유전자", "통화", "미술", "법률", "반도체", "인식론"]
+CUSTOM_TOPICS = [
+    "중앙은행의 기준금리 조정이 채권 가격에 미치는 영향",
+    "칸트의 정언 명령과 공리주의의 비교",
+    "양자 컴퓨터의 큐비트와 중첩 원리",
+    "저작권의 공정 이용 판단 기준",
+]
+
+# 상호작용 종류별 가중치
+ACTION_WEIGHTS = {
+    "select_preset": 3,
+    "search": 2,
+    "custom_input": 2,
+    "preset_generate": 2,
+    "custom_generate": 1,
+    "compare_generate": 1,
+}
+GENERATION_ACTIONS = {"preset_generate", "custom_generate", "compare_generate"}
+# 비교 모드 모델 옵션 (streamlit_viewer.MODEL_OPTIONS의 키)
+COMPARISON_MODEL_OPTION = "비교: Flash vs Large (GPT 0906)"
+# _prepare_concurrent_apptest가 바꿔 끼우는 내부 구현을 확인한 Streamlit 버전 (major.minor)
+SUPPORTED_STREAMLIT_VERSION = "1.49"
+BROWSER_SCREEN_STATS = {"innerHeight": 900, "innerWidth": 1440}
+SAMPLE_OPTION_PATTERN = re.compile(r"Sample #(\d+)")
+
+
+# --- 모의 모델 서버 ---
+class MockModelServer:
+    """Vertex / OpenAI 작가 모델과 Gemini 전문가 모델 API를 흉내 내는 로컬 서버"""
+
+    def __init__(self, writer_latency: float, expert_latency: float, expert_rounds: int):
+        self.writer_latency = writer_latency
+        self.expert_latency = expert_latency
+        self.expert_rounds = expert_rounds
+        self.port = None
+        self._loop = None
+        self._runner = None
+
+    async def _sleep(self, latency: float):
+        # ±30% 지터
+        await asyncio.sleep(latency * random.uniform(0.7, 1.3))
+
+    async def _generate_content(self, request):
+        body = await request.json()
+        model_turns = sum(1 for c in body.get("contents", []) if c.get("role") == "model")
+        await self._sleep(self.writer_latency)
+        if model_turns < self.expert_rounds:
+            text = f"{model_turns + 1}번째 정보를 확인하자.\n<expertcall>모의 질문 {model_turns + 1}: 핵심 개념을 설명해 주세요.</expertcall>"
+        else:
+            paragraphs = [f"모의 지문의 {i + 1}번째 문단이다. " * 8 for i in range(5)]
+            text = "정보를 모두 모았다.\n<passage>" + "\n".join(paragraphs) + "</passage>"
+        prompt_tokens = 1500 + 800 * model_turns
+        return web.json_response({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": 300, "totalTokenCount": prompt_tokens + 300},
+        })
+
+    async def _chat_completions(self, request):
+        body = await request.json()
+        await self._sleep(self.expert_latency)
+        question = body["messages"][-1]["content"]
+        return web.json_response({
+            "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"모의 전문가 응답: {question} " + "설명 문장이다. " * 40}}],
+            "usage": {"prompt_tokens": 600, "completion_tokens": 400, "total_tokens": 1000},
+        })
+
+    async def _writer_chat_completions(self, request):
+        # 비교 모드의 GPT 작가 모델: expert_rounds번 request_for_expert를 호출한 뒤 지문 작성
+        body = await request.json()
+        model_turns = sum(1 for m in body.get("messages", []) if m.get("role") == "assistant")
+        await self._sleep(self.writer_latency)
+        message = {"role": "assistant"}
+        if model_turns < self.expert_rounds:
+            message["content"] = f"<think>\n{model_turns + 1}번째 정보를 확인하자.\n</think>"
+            message["tool_calls"] = [{
+                "id": f"call-{model_turns + 1}", "type": "function",
+                "function": {
+                    "name": "request_for_expert",
+                    "arguments": json.dumps({"input": f"모의 질문 {model_turns + 1}: 핵심 개념을 설명해 주세요."}, ensure_ascii=False),
+                },
+            }]
+        else:
+            paragraphs = [f"모의 지문의 {i + 1}번째 문단이다. " * 8 for i in range(5)]
+            message["content"] = "<think>\n정보를 모두 모았다.\n</think>\n" + "\n".join(paragraphs)
+        prompt_tokens = 1500 + 800 * model_turns
+        return web.json_response({
+            "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "tool_calls" if "tool_calls" in message else "stop", "message": message}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 300, "total_tokens": prompt_tokens + 300},
+        })
+
+    async def _models(self, request):
+        return web.json_response({"object": "list", "data": []})
+
+    async def _root(self, request):
+        return web.Response(text="ok")
+
+    def start(self):
+        """백그라운드 스레드에서 서버를 시작하고 포트를 반환합니다."""
+        ready = threading.Event()
+
+        async def _serve():
+            app = web.Application()
+            app.router.add_post("/v1/projects/{project}/locations/{location}/endpoints/{endpoint}:generateContent", self._generate_content)
+            app.router.add_post("/v1beta/openai/chat/completions", self._chat_completions)
+            app.router.add_get("/v1beta/openai/models", self._models)
+            app.router.add_post("/v1/chat/completions", self._writer_chat_completions)
+            app.router.add_route("*", "/", self._root)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            ready.set()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(_serve())
+            self._loop.run_forever()
+
+        threading.Thread(target=_run, name="mock-model-server", daemon=True).start()
+        ready.wait()
+        return self.port
+
+
+def _serve_mock(writer_latency: float, expert_latency: float, expert_rounds: int, conn):
+    server = MockModelServer(writer_latency, expert_latency, expert_rounds)
+    conn.send(server.start())
+    threading.Event().wait()
+
+
+def start_mock_server_process(writer_latency: float, expert_latency: float, expert_rounds: int):
+    """모의 서버를 별도 프로세스로 띄우고 (프로세스, 포트)를 반환합니다. (서버 처리가 CPU 측정에 섞이지 않도록)"""
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    process = ctx.Process(
+        target=_serve_mock, args=(writer_latency, expert_latency, expert_rounds, child_conn),
+        name="mock-model-server", daemon=True,
+    )
+    process.start()
+    return process, parent_conn.recv()
+
+
+# --- 세션 시뮬레이션 ---
+def _prepare_concurrent_apptest():
+    """AppTest를 여러 스레드에서 동시에 돌릴 수 있도록 준비합니다.
+
+    - AppTest는 실행할 때마다 전역 Runtime._instance를 설정했다가 None으로 되돌리므로,
+      먼저 끝난 세션이 다른 세션의 런타임을 지워버립니다. 마지막으로 설정된 모의 런타임을
+      기억해 두고, 비어 있을 때 대신 돌려줍니다.
+    - AppTest는 실행마다 ScriptCache를 새로 만들어 스크립트를 매번 다시 컴파일합니다.
+      실제 서버처럼 바이트코드 캐시 하나를 공유합니다. (동시 컴파일 시 AST 오류도 방지)
+    - AppTest는 실행마다 config.get_option을 바꿔 끼워 global.appTest를 켰다가 되돌리므로,
+      먼저 끝난 세션이 실행 중인 다른 세션의 설정을 원래대로 돌려놓습니다. 그러면 그 세션의
+      selectbox format_func가 저장되지 않아 다음 상호작용이 KeyError로 실패합니다.
+      프로세스 전체에서 한 번 켜 두고 실행마다 바꿔 끼우지 않도록 합니다.
+
+    모두 Streamlit 내부 구현이므로 SUPPORTED_STREAMLIT_VERSION이 아니면 실행하지 않습니다.
+    """
+    import streamlit
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner, util
+
+    version = ".".join(streamlit.__version__.split(".")[:2])
+    if version != SUPPORTED_STREAMLIT_VERSION:
+        raise RuntimeError(
+            f"load_test.py는 Streamlit {SUPPORTED_STREAMLIT_VERSION}.x의 내부 구현에 맞춰져 있습니다 "
+            f"(설치된 버전: {streamlit.__version__}). requirements.txt의 고정 버전을 설치하세요."
+        )
+    if not (hasattr(Runtime, "_instance") and hasattr(app_test, "ScriptCache") and hasattr(local_script_runner, "ScriptCache")
+            and hasattr(app_test, "patch_config_options") and hasattr(util, "build_mock_config_get_option")):
+        raise RuntimeError("Streamlit 내부 구현이 예상과 다릅니다. (Runtime._instance / AppTest ScriptCache / patch_config_options)")
+
+    original_instance = Runtime.instance.__func__
+    shared = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            shared["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" in shared:
+            return shared["runtime"]
+        return original_instance(cls)
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in shared
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = lambda: script_cache
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    config.get_option = util.build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+
+def _rss_bytes() -> int:
+    """현재 프로세스 RSS (리눅스 /proc 기준, 없으면 최대 RSS)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _perform(at, action: str, rng: random.Random):
+    if action == "select_preset":
+        picker = at.selectbox(key="preset_sample")  # 검증 데이터셋 샘플
+        # options는 format_func를 거친 문자열이므로 "Sample #N"에서 실제 값을 꺼냄
+        sample_ids = [int(m.group(1)) for m in map(SAMPLE_OPTION_PATTERN.match, picker.options) if m]
+        picker.set_value(rng.choice(sample_ids)).run()
+    elif action == "search":
+        at.text_input(key="preset_search").input(rng.choice(SEARCH_KEYWORDS)).run()
+    elif action == "custom_input":
+        at.text_area(key="custom_topic").input(rng.choice(CUSTOM_TOPICS)).run()
+    elif action == "preset_generate":
+        at.text_input(key="preset_search").input("").run()
+        at.button(key="preset_run").click().run()
+    elif action == "custom_generate":
+        at.text_area(key="custom_topic").input(rng.choice(CUSTOM_TOPICS)).run()
+        at.button(key="custom_run").click().run()
+    elif action == "compare_generate":
+        # 두 작가 모델을 동시에 실행하는 비교 모드로 생성한 뒤, 다음 상호작용부터는 기본 모델로 되돌림
+        model_picker = at.selectbox(key="model_name")
+        default_model = model_picker.value
+        at.text_input(key="preset_search").input("")
+        model_picker.set_value(COMPARISON_MODEL_OPTION).run()
+        at.button(key="preset_run").click().run()
+        at.selectbox(key="model_name").set_value(default_model)
+
+
+def run_session(session_idx: int, interactions: int, timeout: float, seed: int, actions: list[str] | None = None) -> dict:
+    """세션 하나를 시뮬레이션합니다. actions를 주면 그 순서대로, 아니면 가중치에 따라 무작위로 상호작용합니다."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + session_idx)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    # 브라우저가 없으므로 화면 크기 컴포넌트의 응답을 미리 넣어둠
+    # (없으면 st_screen_data가 매 실행마다 응답을 5초간 기다림)
+    at.session_state["screen_stats"] = BROWSER_SCREEN_STATS
+    # 메모리 측정이 끝날 때까지 세션 상태가 살아 있도록 AppTest를 결과에 담아 반환
+    result = {"rerun": [], "generation": [], "errors": 0, "app": at}
+
+    started = time.perf_counter()
+    at.run()
+    result["rerun"].append(time.perf_counter() - started)
+
+    if actions is None:
+        actions = rng.choices(list(ACTION_WEIGHTS), list(ACTION_WEIGHTS.values()), k=interactions)
+    for action in actions:
+        started = time.perf_counter()
+        try:
+            _perform(at, action, rng)
+            if at.exception:
+                result["errors"] += 1
+        except Exception:
+            result["errors"] += 1
+            continue
+        elapsed = time.perf_counter() - started
+        result["generation" if action in GENERATION_ACTIONS else "rerun"].append(elapsed)
+    return result
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 3)
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "count": len(ordered)}
+
+
+def run_level(concurrency: int, interactions: int, timeout: float, seed: int, rss_baseline: int) -> dict:
+    """동시 세션 concurrency개를 실행하고 지연 / 자원 사용량을 집계합니다.
+
+    세션당 메모리는 예열 직후 RSS(rss_baseline) 대비 증가분을 세션 수로 나눈 값입니다.
+    앞 단계에서 해제된 메모리는 할당기가 재사용하므로 단계 시작 시점이 아닌 고정 기준을 씁니다.
+    """
+    # 이 프로세스 전체의 CPU 시간 (모의 서버는 별도 프로세스라 제외됨)
+    cpu_before = time.process_time()
+    wall_started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: run_session(i, interactions, timeout, seed), range(concurrency)))
+
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_before
+    rss_after = _rss_bytes()
+    for result in results:
+        result.pop("app")
+
+    reruns = [v for r in results for v in r["rerun"]]
+    generations = [v for r in results for v in r["generation"]]
+    return {
+        "concurrency": concurrency,
+        "wall_sec": round(wall, 2),
+        "rerun": _percentiles(reruns),
+        "generation": _percentiles(generations),
+        "errors": sum(r["errors"] for r in results),
+        "cpu_sec_per_session": round(cpu / concurrency, 3),
+        "cpu_utilization": round(cpu / wall, 2) if wall else 0.0,
+        "rss_mb_per_session": round(max(0, rss_after - rss_baseline) / concurrency / 2**20, 2),
+        "rss_mb_total": round(rss_after / 2**20, 1),
+    }
+
+
+def estimate_capacity(levels: list[dict], rerun_slo: float, generation_slo: float) -> int:
+    """오류 없이 rerun / 생성 p95가 SLO 안에 드는 최대 동시 세션 수"""
+    capacity = 0
+    for level in levels:
+        rerun_p95 = level["rerun"]["p95"] or 0.0
+        generation_p95 = level["generation"]["p95"] or 0.0
+        if level["errors"] == 0 and rerun_p95 <= rerun_slo and generation_p95 <= generation_slo:
+            capacity = level["concurrency"]
+        else:
+            break
+    return capacity
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="streamlit_viewer.py 동시 세션 부하 테스트")
+    parser.add_argument("--levels", default="1,2,4,8", help="단계별 동시 세션 수 (쉼표 구분)")
+    parser.add_argument("--interactions", type=int, default=6, help="세션당 상호작용 수 (첫 페이지 로드 제외)")
+    parser.add_argument("--writer-latency", type=float, default=1.0, help="모의 작가 모델 응답 지연(초)")
+    parser.add_argument("--expert-latency", type=float, default=1.5, help="모의 전문가 모델 응답 지연(초)")
+    parser.add_argument("--expert-rounds", type=int, default=2, help="지문 작성 전 전문가 질의 라운드 수")
+    parser.add_argument("--rerun-slo", type=float, default=1.0, help="상호작용 재실행 p95 허용치(초)")
+    parser.add_argument("--generation-slo", type=float, default=30.0, help="지문 생성 p95 허용치(초)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="AppTest 실행 1회의 제한 시간(초)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="결과를 저장할 JSON 경로")
+    args = parser.parse_args(argv)
+
+    server_process, port = start_mock_server_process(args.writer_latency, args.expert_latency, args.expert_rounds)
+
+    # 모의 생성 기록이 실제 로그 / 캐시에 섞이지 않도록 임시 디렉터리 사용 (앱 임포트 전에 설정)
+    state_dir = tempfile.mkdtemp(prefix="ksat-load-test-")
+    os.environ["GENERATION_LOG_DIR"] = os.path.join(state_dir, "logs")
+    os.environ["APP_CACHE_DIR"] = os.path.join(state_dir, "cache")
+    print(f"로그 / 캐시 디렉터리: {state_dir}", flush=True)
+    # 모의 작가의 질의는 세션마다 같으므로, 응답 재사용을 끄지 않으면 예열 이후 세션은 전문가 경로를 타지 않음
+    os.environ["EXPERT_MEMORY_THRESHOLD"] = "2"
+
+    # 스크립트가 모의 서버를 보도록 환경 설정 (AppTest는 같은 프로세스에서 스크립트를 실행)
+    os.environ["VERTEX_API_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["EXPERT_API_BASE_URL"] = f"http://127.0.0.1:{port}/v1beta/openai/"
+    os.environ["OPENAI_API_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["VERTEX_ACCESS_TOKEN"] = "load-test"
+    os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+    app_dir = os.path.dirname(APP_PATH)
+    os.chdir(app_dir)
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+
+    _prepare_concurrent_apptest()
+
+    # 첫 실행의 모듈 임포트, 검색 인덱스 / 토크나이저 로딩은 측정에서 제외하고 따로 보고
+    started = time.perf_counter()
+    warmup = run_session(0, 0, args.timeout, args.seed, actions=list(ACTION_WEIGHTS))
+    cold_start = time.perf_counter() - started
+    warmup.pop("app")
+    gc.collect()
+    rss_baseline = _rss_bytes()
+    print(f"예열 세션: {cold_start:.2f}s (오류 {warmup['errors']})", flush=True)
+
+    levels = []
+    for concurrency in [int(x) for x in args.levels.split(",") if x.strip()]:
+        level = run_level(concurrency, args.interactions, args.timeout, args.seed, rss_baseline)
+        levels.append(level)
+        print(
+            f"동시 {level['concurrency']:>3} | rerun p50 {level['rerun']['p50']}s p95 {level['rerun']['p95']}s"
+            f" | 생성 p50 {level['generation']['p50']}s p95 {level['generation']['p95']}s"
+            f" | CPU/세션 {level['cpu_sec_per_session']}s (사용률 {level['cpu_utilization']})"
+            f" | RSS/세션 {level['rss_mb_per_session']}MB | 오류 {level['errors']}",
+            flush=True,
+        )
+
+    capacity = estimate_capacity(levels, args.rerun_slo, args.generation_slo)
+    print(f"\n수용 가능 동시 세션 수: {capacity} (rerun p95 ≤ {args.rerun_slo}s, 생성 p95 ≤ {args.generation_slo}s)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "cold_start_sec": round(cold_start, 2), "levels": levels, "capacity": capacity}, f, ensure_ascii=False, indent=2)
+
+    server_process.terminate()
+
+
+if __name__ == "__main__":
+    main()
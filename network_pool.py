@@ -0,0 +1,247 @@
+"""작가/전문가 모델 호출이 공유하는 네트워크 자원.
+
+Streamlit은 생성할 때마다 asyncio.run으로 새 이벤트 루프를 만들기 때문에, 루프에 묶인
+aiohttp 세션이나 AsyncOpenAI 클라이언트를 재사용할 수 없고 매번 DNS 조회와 TLS 연결을
+새로 맺게 됩니다. 이 모듈은 데몬 스레드에서 도는 이벤트 루프 하나에 연결 풀을 두고,
+각 세션의 루프에서는 run_on_pool로 코루틴을 넘겨 실행합니다. 호출자 쪽에서 취소하면
+풀 루프의 작업도 함께 취소됩니다.
+
+모듈 수준 상태는 sys.modules에 한 번만 올라가므로 스크립트 재실행과 무관하게 유지됩니다.
+프로세스가 끝날 때는 atexit으로 세션과 클라이언트를 풀 루프에서 닫고 루프를 멈춥니다.
+"""
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import google.auth
+import google.auth.transport.requests
+from openai import AsyncOpenAI
+
+logger = logging.getLogger("KSAT_Model_Preview")
+
+CLOUD_PLATFORM_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+# 토큰 만료까지 이 시간보다 적게 남으면 미리 갱신
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+# 풀에 남겨둘 유휴 연결 유지 시간(초)과 최대 연결 수
+KEEPALIVE_TIMEOUT_SEC = 120
+MAX_CONNECTIONS = 100
+# 종료 시 연결을 닫는 작업을 기다리는 최대 시간(초)
+SHUTDOWN_TIMEOUT_SEC = 5
+# 같은 대상에 대한 예열 요청 최소 간격(초)
+PREWARM_MIN_INTERVAL_SEC = 60
+# 연결 실패 / 시간 초과 등 전송 계층 오류 (엔드포인트 장애로 볼 수 있는 예외)
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+_http_session = None
+_openai_clients = {}
+
+_credentials = None
+_credentials_lock = threading.Lock()
+
+_last_prewarm = {}
+_prewarm_lock = threading.Lock()
+
+
+# --- 백그라운드 이벤트 루프 ---
+def get_loop() -> asyncio.AbstractEventLoop:
+    """연결 풀이 올라가는 백그라운드 이벤트 루프를 반환합니다. (최초 호출 시 시작)"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="ksat-network-pool", daemon=True)
+            thread.start()
+            _loop, _loop_thread = loop, thread
+            # 로그 리스너(generation_log)보다 나중에 등록되므로 리스너가 멈추기 전에 실행됨 (atexit은 역순)
+            atexit.register(shutdown)
+        return _loop
+
+
+async def _close_resources():
+    current = asyncio.current_task()
+    pending = [task for task in asyncio.all_tasks() if task is not current]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    for client in _openai_clients.values():
+        await client.close()
+    _openai_clients.clear()
+
+
+def shutdown(timeout: float = SHUTDOWN_TIMEOUT_SEC):
+    """풀 루프의 작업을 취소하고 HTTP 세션 / OpenAI 클라이언트를 닫은 뒤 루프를 멈춥니다."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        loop, thread = _loop, _loop_thread
+        _loop = _loop_thread = None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_resources(), loop).result(timeout)
+    except Exception as e:
+        logger.warning(f"네트워크 풀 종료 중 오류: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    if not thread.is_alive():
+        loop.close()
+
+
+async def run_on_pool(coro):
+    """코루틴을 풀 루프에서 실행하고 결과를 기다립니다. 기다리는 쪽이 취소되면 풀 작업도 취소됩니다."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    return await asyncio.wrap_future(future)
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    """풀 루프 안에서만 호출합니다."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            ttl_dns_cache=300,
+            keepalive_timeout=KEEPALIVE_TIMEOUT_SEC,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector)
+    return _http_session
+
+
+def _get_openai_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    """풀 루프 안에서만 호출합니다. (httpx 연결 풀이 루프에 묶이므로)"""
+    key = (api_key, base_url)
+    if key not in _openai_clients:
+        _openai_clients[key] = AsyncOpenAI(api_key=api_key, base_url=base_url)
+    return _openai_clients[key]
+
+
+async def _post(url: str, headers: dict, **kwargs) -> tuple[int, dict | str]:
+    async def _request():
+        async with _get_http_session().post(url, headers=headers, **kwargs) as response:
+            if response.status == 200:
+                return response.status, await response.json()
+            return response.status, await response.text()
+    return await run_on_pool(_request())
+
+
+async def post_body(url: str, headers: dict, body: bytes | bytearray) -> tuple[int, dict | str]:
+    """이미 직렬화된 JSON 본문을 풀 세션으로 POST하고 (상태 코드, 응답 JSON 또는 본문 텍스트)를 반환합니다."""
+    return await _post(url, {**headers, "Content-Type": "application/json"}, data=body)
+
+
+async def chat_completion(api_key: str, base_url: str, **kwargs):
+    """풀에 보관된 AsyncOpenAI 클라이언트로 chat.completions.create를 호출합니다."""
+    async def _create():
+        return await _get_openai_client(api_key, base_url).chat.completions.create(**kwargs)
+    return await run_on_pool(_create())
+
+
+# --- Vertex AI 자격 증명 캐시 ---
+def _load_credentials(service_account_json: str | None):
+    """서비스 계정 키 JSON → gcloud 사용자 인증 → GOOGLE_APPLICATION_CREDENTIALS 순으로 시도합니다."""
+    # 1. 호출자가 넘긴 서비스 계정 키 (Streamlit Cloud Secrets의 JSON 문자열)
+    creds_json = service_account_json
+    if creds_json:
+        from google.oauth2 import service_account
+        try:
+            return service_account.Credentials.from_service_account_info(json.loads(creds_json), scopes=CLOUD_PLATFORM_SCOPES)
+        except Exception as e:
+            logger.warning(f"Streamlit Secrets 인증 실패: {e}")
+
+    # 2. 로컬 환경에서 gcloud CLI 인증 시도
+    original_creds = os.environ.pop('GOOGLE_APPLICATION_CREDENTIALS', None)
+    try:
+        credentials, _ = google.auth.default(scopes=CLOUD_PLATFORM_SCOPES)
+        return credentials
+    except Exception:
+        # 3. gcloud 인증 실패 시, 환경변수 인증 재시도
+        if not (original_creds and os.path.exists(original_creds)):
+            raise
+    finally:
+        if original_creds:
+            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = original_creds
+    credentials, _ = google.auth.default(scopes=CLOUD_PLATFORM_SCOPES)
+    return credentials
+
+
+def _needs_refresh(credentials) -> bool:
+    if not credentials.token:
+        return True
+    if credentials.expiry is None:
+        return False
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth의 expiry는 naive UTC
+    return credentials.expiry - TOKEN_REFRESH_MARGIN <= now
+
+
+def fetch_vertex_ai_token(service_account_json: str | None = None) -> str:
+    """캐시된 자격 증명의 액세스 토큰을 반환합니다. 만료가 가까우면 갱신합니다. (실패 시 예외)
+
+    service_account_json은 자격 증명을 처음 불러올 때만 사용합니다.
+    """
+    global _credentials
+    # 미리 발급받은 토큰이 주어지면 그대로 사용 (로컬 모의 서버 / 부하 테스트용)
+    static_token = os.getenv("VERTEX_ACCESS_TOKEN")
+    if static_token:
+        return static_token
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = _load_credentials(service_account_json)
+        if _needs_refresh(_credentials):
+            _credentials.refresh(google.auth.transport.requests.Request())
+        return _credentials.token
+
+
+# --- 예열 ---
+async def _prewarm(urls: list[str], expert_api_key: str | None, expert_base_url: str, service_account_json: str | None):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+
+    async def _warm_token():
+        try:
+            await loop.run_in_executor(None, fetch_vertex_ai_token, service_account_json)
+        except Exception as e:
+            logger.warning(f"예열 중 Vertex AI 토큰 갱신 실패: {e}")
+
+    async def _warm_connection(url: str):
+        # 응답 코드와 무관하게 DNS 조회와 TLS 연결만 맺어 풀에 남겨둠
+        try:
+            async with _get_http_session().head(url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                await response.read()
+        except Exception as e:
+            logger.warning(f"예열 중 {url} 연결 실패: {e}")
+
+    async def _warm_expert():
+        if not expert_api_key:
+            return
+        try:
+            await _get_openai_client(expert_api_key, expert_base_url).models.list()
+        except Exception as e:
+            logger.warning(f"예열 중 전문가 모델 연결 실패: {e}")
+
+    await asyncio.gather(_warm_token(), _warm_expert(), *(_warm_connection(url) for url in urls))
+    logger.info(f"연결 예열 완료 ({time.perf_counter() - started:.2f}s)")
+
+
+def schedule_prewarm(urls: list[str], expert_api_key: str | None, expert_base_url: str,
+                     service_account_json: str | None = None, min_interval: float = PREWARM_MIN_INTERVAL_SEC) -> bool:
+    """토큰 갱신과 연결 예열을 백그라운드에서 시작합니다. 호출자는 기다리지 않습니다.
+
+    최근 min_interval초 안에 같은 대상으로 예열했다면 아무것도 하지 않고 False를 반환합니다.
+    """
+    key = (tuple(urls), expert_base_url)
+    now = time.monotonic()
+    with _prewarm_lock:
+        if now - _last_prewarm.get(key, float("-inf")) < min_interval:
+            return False
+        _last_prewarm[key] = now
+    asyncio.run_coroutine_threadsafe(_prewarm(urls, expert_api_key, expert_base_url, service_account_json), get_loop())
+    return True
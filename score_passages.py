@@ -0,0 +1,303 @@
+"""생성 지문과 기대 지문(<passage>) 비교 채점 스크립트.
+
+생성 결과 JSONL의 각 줄을 데이터셋의 기대 지문과 짝지어 다음 지표를 계산합니다.
+
+- 문자 n-gram(1~3) 겹침: ROUGE-N 방식의 정밀도 / 재현율 / F1
+- 길이 비율: 생성 지문 글자 수 / 기대 지문 글자 수 (공백 제외)
+- 문단 구조 유사도: 문단 수 비율과 문단 길이 분포(정규화 후 재표본화)의 코사인 유사도
+- 반복 지표: distinct-3 비율, 반복 trigram 비율, 중복 문장 비율
+
+n-gram은 유니코드 코드포인트를 64비트 정수로 묶어 NumPy 배열 연산(np.unique /
+np.intersect1d)으로 세고, 여러 쌍은 multiprocessing으로 나누어 처리합니다. 기대 지문의
+n-gram / 문단 분포는 샘플마다 한 번만 계산해 같은 샘플을 쓰는 쌍이 함께 사용합니다.
+
+입력 JSONL 한 줄 형식 (생성 로그 레코드를 그대로 사용할 수 있습니다):
+    {"user_prompt": "분야: ...\\n유형: ...\\n주제: ...", "final_passage": "...", "model": "ksat-exp-09-06-flash"}
+    또는 {"dataset": "GPT-sft-09-06-val.jsonl", "dataset_index": 3, "final_passage": "..."}
+
+레코드에 dataset(파일 이름)이 있으면 --dataset과 같은 디렉터리의 그 파일에서 기대 지문을 찾고,
+없으면 --dataset 파일을 사용합니다.
+
+사용 예:
+    python score_passages.py generated.jsonl --output scores.jsonl --summary summary.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from ksat_dataset import iter_samples, parse_prompt_structure
+
+DEFAULT_DATASET_PATH = "Gemini-sft-09-07-val.jsonl"
+NGRAM_SIZES = (1, 2, 3)
+PARAGRAPH_PROFILE_BINS = 16
+
+# 평균을 낼 지표 목록 (출력 순서)
+METRIC_KEYS = [
+    "rouge1_f", "rouge2_p", "rouge2_r", "rouge2_f", "rouge3_f",
+    "length_ratio", "paragraph_count_ratio", "paragraph_profile_sim",
+    "distinct3", "repeated_trigram_ratio", "duplicate_sentence_ratio",
+]
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.?!다])\s+")
+
+
+# --- 벡터화된 n-gram 계산 ---
+def _codepoints(text: str) -> np.ndarray:
+    """공백을 제거한 텍스트의 코드포인트 배열 (uint64)"""
+    compact = _WHITESPACE_PATTERN.sub("", text)
+    return np.frombuffer(compact.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+
+def _ngram_codes(points: np.ndarray, n: int) -> np.ndarray:
+    """코드포인트 배열에서 n-gram 정수 코드를 만듭니다. (코드포인트는 21비트 이하)"""
+    if len(points) < n:
+        return np.empty(0, dtype=np.uint64)
+    codes = points[:len(points) - n + 1].copy()
+    for offset in range(1, n):
+        codes = (codes << np.uint64(21)) | points[offset:len(points) - n + 1 + offset]
+    return codes
+
+
+def _ngram_counts(points: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    return np.unique(_ngram_codes(points, n), return_counts=True)
+
+
+def _overlap(gen_counts, ref_counts) -> tuple[float, float, float]:
+    """두 n-gram 빈도표의 겹침으로 (정밀도, 재현율, F1)을 계산합니다."""
+    gen_codes, gen_freq = gen_counts
+    ref_codes, ref_freq = ref_counts
+    gen_total = gen_freq.sum()
+    ref_total = ref_freq.sum()
+    if gen_total == 0 or ref_total == 0:
+        return 0.0, 0.0, 0.0
+    _, gen_idx, ref_idx = np.intersect1d(gen_codes, ref_codes, assume_unique=True, return_indices=True)
+    matched = np.minimum(gen_freq[gen_idx], ref_freq[ref_idx]).sum()
+    precision = matched / gen_total
+    recall = matched / ref_total
+    f1 = 0.0 if matched == 0 else 2 * precision * recall / (precision + recall)
+    return float(precision), float(recall), float(f1)
+
+
+# --- 구조 / 반복 지표 ---
+def _paragraphs(text: str) -> list[str]:
+    return [p.strip() for p in text.strip().split("\n") if p.strip()]
+
+
+def _paragraph_profile(paragraphs: list[str]) -> np.ndarray:
+    """문단 길이 분포를 고정 길이 벡터로 재표본화합니다. (합이 1이 되도록 정규화)"""
+    lengths = np.array([len(p) for p in paragraphs], dtype=np.float64)
+    if lengths.size == 0:
+        return np.zeros(PARAGRAPH_PROFILE_BINS)
+    # 누적 길이 비율을 기준으로 각 구간에 해당하는 문단 길이를 보간
+    positions = (np.cumsum(lengths) - lengths / 2) / lengths.sum()
+    grid = np.linspace(0, 1, PARAGRAPH_PROFILE_BINS)
+    profile = np.interp(grid, positions, lengths / lengths.sum())
+    return profile / profile.sum()
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> float:
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denom) if denom else 0.0
+
+
+def _repetition(points: np.ndarray, text: str) -> tuple[float, float, float]:
+    """(distinct-3 비율, 두 번 이상 등장한 trigram이 차지하는 비율, 중복 문장 비율)"""
+    codes, freq = _ngram_counts(points, 3)
+    total = freq.sum()
+    if total == 0:
+        distinct3 = repeated = 0.0
+    else:
+        distinct3 = len(codes) / total
+        repeated = freq[freq > 1].sum() / total
+
+    sentences = [s.strip() for s in _SENTENCE_PATTERN.split(text) if len(s.strip()) > 5]
+    duplicate_sentences = (len(sentences) - len(set(sentences))) / len(sentences) if sentences else 0.0
+    return float(distinct3), float(repeated), float(duplicate_sentences)
+
+
+def reference_features(reference: str) -> dict:
+    """기대 지문 쪽 계산 결과 (n-gram 빈도표, 길이, 문단 수, 문단 분포). 샘플마다 한 번만 만듭니다."""
+    points = _codepoints(reference)
+    paragraphs = _paragraphs(reference)
+    return {
+        "length": len(points),
+        "ngram_counts": {n: _ngram_counts(points, n) for n in NGRAM_SIZES},
+        "paragraphs": len(paragraphs),
+        "profile": _paragraph_profile(paragraphs),
+    }
+
+
+def score_against(generated: str, ref: dict) -> dict:
+    """생성 지문 하나를 미리 계산한 기대 지문(reference_features)과 비교한 지표를 반환합니다."""
+    gen_points = _codepoints(generated)
+
+    scores = {}
+    for n in NGRAM_SIZES:
+        precision, recall, f1 = _overlap(_ngram_counts(gen_points, n), ref["ngram_counts"][n])
+        scores[f"rouge{n}_p"] = precision
+        scores[f"rouge{n}_r"] = recall
+        scores[f"rouge{n}_f"] = f1
+
+    scores["length_ratio"] = float(len(gen_points) / ref["length"]) if ref["length"] else 0.0
+
+    gen_paragraphs = _paragraphs(generated)
+    if gen_paragraphs and ref["paragraphs"]:
+        scores["paragraph_count_ratio"] = min(len(gen_paragraphs), ref["paragraphs"]) / max(len(gen_paragraphs), ref["paragraphs"])
+    else:
+        scores["paragraph_count_ratio"] = 0.0
+    scores["paragraph_profile_sim"] = _cosine(_paragraph_profile(gen_paragraphs), ref["profile"])
+
+    distinct3, repeated, duplicate_sentences = _repetition(gen_points, generated)
+    scores["distinct3"] = distinct3
+    scores["repeated_trigram_ratio"] = repeated
+    scores["duplicate_sentence_ratio"] = duplicate_sentences
+    return scores
+
+
+def score_pair(generated: str, reference: str) -> dict:
+    """생성 지문 하나와 기대 지문 하나를 비교한 지표를 반환합니다."""
+    return score_against(generated, reference_features(reference))
+
+
+# 작업 프로세스가 공유하는 (데이터셋 경로, 줄 번호) → reference_features (풀 초기화 때 한 번 전달)
+_references = {}
+
+
+def _init_worker(references: dict):
+    global _references
+    _references = references
+
+
+def _score_job(job: tuple) -> dict:
+    record_id, model, field, generated, ref_key = job
+    result = {"id": record_id, "model": model, "field": field}
+    result.update(score_against(generated, _references[ref_key]))
+    return result
+
+
+# --- 입력 짝짓기 / 집계 ---
+def load_references(dataset_path: str) -> tuple[dict, dict]:
+    """데이터셋에서 (줄 번호 → (줄 번호, 샘플)), (사용자 프롬프트 → (줄 번호, 샘플)) 조회표를 만듭니다."""
+    by_index = {}
+    by_prompt = {}
+    for index, sample in iter_samples(dataset_path):
+        by_index[index] = (index, sample)
+        by_prompt.setdefault(sample.user_prompt.strip(), (index, sample))
+    return by_index, by_prompt
+
+
+def build_jobs(generated_path: str, dataset_path: str, default_model: str) -> tuple[list, dict, int]:
+    """채점할 (id, 모델, 분야, 생성 지문, 기대 지문 키) 목록, 기대 지문 키 → reference_features,
+    짝을 찾지 못한 줄 수를 반환합니다.
+    """
+    dataset_dir = os.path.dirname(dataset_path)
+    lookups = {}     # 데이터셋 경로 -> (줄 번호 → (줄 번호, 샘플), 사용자 프롬프트 → (줄 번호, 샘플)), 없으면 None
+    references = {}  # (데이터셋 경로, 줄 번호) -> reference_features
+    jobs = []
+    unmatched = 0
+    with open(generated_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            generated = record.get("final_passage") or record.get("generated") or ""
+
+            # 레코드가 생성된 데이터셋에서 기대 지문을 찾음 (줄 번호는 데이터셋마다 다름)
+            path = os.path.join(dataset_dir, record["dataset"]) if record.get("dataset") else dataset_path
+            if path not in lookups:
+                lookups[path] = load_references(path) if os.path.exists(path) else None
+            lookup = lookups[path]
+
+            found = None
+            if lookup is not None:
+                by_index, by_prompt = lookup
+                if record.get("dataset_index") is not None:
+                    found = by_index.get(int(record["dataset_index"]))
+                if found is None and record.get("user_prompt"):
+                    found = by_prompt.get(record["user_prompt"].strip())
+            if found is None or not generated or not found[1].expected_response:
+                unmatched += 1
+                continue
+
+            index, sample = found
+            ref_key = (path, index)
+            if ref_key not in references:
+                references[ref_key] = reference_features(sample.expected_response)
+            field, _, _ = parse_prompt_structure(sample.user_prompt)
+            record_id = record.get("generation_id", line_no)
+            model = record.get("model") or default_model
+            jobs.append((record_id, model, field or "미분류", generated, ref_key))
+    return jobs, references, unmatched
+
+
+def aggregate(results: list[dict]) -> dict:
+    """모델 버전별, 분야별 평균 지표를 계산합니다. (분야 '전체' 포함)"""
+    grouped = defaultdict(list)
+    for result in results:
+        grouped[(result["model"], result["field"])].append(result)
+        grouped[(result["model"], "전체")].append(result)
+
+    summary = defaultdict(dict)
+    for (model, field), rows in sorted(grouped.items()):
+        matrix = np.array([[row[key] for key in METRIC_KEYS] for row in rows], dtype=np.float64)
+        means = matrix.mean(axis=0)
+        summary[model][field] = {"count": len(rows), **{key: round(float(v), 4) for key, v in zip(METRIC_KEYS, means)}}
+    return dict(summary)
+
+
+def score_all(jobs: list, references: dict, workers: int) -> list[dict]:
+    if workers <= 1 or len(jobs) < 2 * workers:
+        _init_worker(references)
+        return [_score_job(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(references,)) as pool:
+        return pool.map(_score_job, jobs, chunksize=chunksize)
+
+
+def print_summary(summary: dict, out=sys.stdout):
+    columns = ["count", "rouge2_f", "length_ratio", "paragraph_profile_sim", "distinct3", "duplicate_sentence_ratio"]
+    print("\t".join(["model", "분야"] + columns), file=out)
+    for model, fields in summary.items():
+        for field, row in fields.items():
+            print("\t".join([model, field] + [str(row[c]) for c in columns]), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="생성 지문을 기대 지문과 비교해 채점합니다.")
+    parser.add_argument("generated", help="생성 결과 JSONL 경로")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH,
+                        help="기대 지문을 가져올 데이터셋 JSONL (레코드에 dataset이 있으면 같은 디렉터리의 그 파일)")
+    parser.add_argument("--model", default="unknown", help="레코드에 model 필드가 없을 때 사용할 모델 버전 이름")
+    parser.add_argument("--output", help="샘플별 점수를 저장할 JSONL 경로")
+    parser.add_argument("--summary", help="모델/분야별 집계를 저장할 JSON 경로")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="채점 프로세스 수")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    jobs, references, unmatched = build_jobs(args.generated, args.dataset, args.model)
+    results = score_all(jobs, references, args.workers)
+    summary = aggregate(results)
+    elapsed = time.perf_counter() - started
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print_summary(summary)
+    print(f"\n{len(results)}쌍 채점 완료 ({elapsed:.2f}s, 짝을 찾지 못한 줄 {unmatched}개)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""데이터셋 전문(全文) 검색용 문자 n-gram 역색인.
+
+사용자 프롬프트(주제), 전문가 질의/응답, 기대 지문을 문자 bigram/trigram으로 쪼개
+역색인을 만들고 BM25 방식으로 순위를 매깁니다. 한국어는 형태소 분석 없이도
+문자 n-gram만으로 부분 일치("채권" → "채권자", "전환사채권")를 잡을 수 있습니다.
+
+질의의 한 글자 단어("법", "채권 법"의 "법")를 위해 글자 단위(unigram) 게시 목록도 함께
+두지만, 두 글자 이상의 단어는 n-gram만 사용하고 문서 길이에도 n-gram만 반영하므로 순위에
+영향을 주지 않습니다.
+
+색인은 gzip JSON 파일로 저장되며, 데이터셋 파일 뒤에 줄이 추가된 경우에는
+추가된 줄만 읽어 색인을 갱신합니다. 파일이 줄어들거나 교체되면 전체를 다시 만듭니다.
+"""
+import gzip
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from ksat_dataset import parse_line
+
+INDEX_VERSION = 3
+NGRAM_SIZES = (2, 3)
+
+# 필드별 가중치: 주제가 일치하는 샘플을 본문 일치보다 위로 올립니다.
+FIELD_WEIGHTS = {
+    "prompt": 3.0,
+    "expert": 1.0,
+    "passage": 1.0,
+}
+
+# BM25 파라미터
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """소문자화하고 연속 공백을 하나로 줄입니다."""
+    return _WHITESPACE_PATTERN.sub(" ", text.lower()).strip()
+
+
+def char_ngrams(text: str, sizes=NGRAM_SIZES) -> list[str]:
+    """공백을 포함하지 않는 문자 n-gram 목록을 반환합니다. (단어 단위로 쪼갠 뒤 생성)"""
+    grams = []
+    for word in normalize_text(text).split(" "):
+        for n in sizes:
+            if len(word) < n:
+                continue
+            grams.extend(word[i:i + n] for i in range(len(word) - n + 1))
+    return grams
+
+
+def char_unigrams(text: str) -> list[str]:
+    """공백을 제외한 글자 목록 (한 글자 질의용 게시 목록)"""
+    return [ch for ch in normalize_text(text) if ch != " "]
+
+
+def query_terms(query: str) -> set[str]:
+    """검색어의 n-gram과 한 글자 단어 (한 글자 단어는 n-gram이 없으므로 unigram 게시 목록과 맞춤)"""
+    terms = set(char_ngrams(query))
+    terms.update(word for word in normalize_text(query).split(" ") if len(word) == 1)
+    return terms
+
+
+def _topic_of(user_prompt: str) -> str:
+    for line in user_prompt.splitlines():
+        if line.strip().startswith("주제:"):
+            return line.split(":", 1)[1].strip()
+    return user_prompt.strip()
+
+
+@dataclass
+class SearchHit:
+    source: str
+    index: int
+    score: float
+    topic: str
+
+
+class NgramSearchIndex:
+    """데이터셋 파일들에 대한 문자 n-gram 역색인"""
+
+    def __init__(self, paths: list[str], index_path: str):
+        self.paths = list(paths)
+        self.index_path = index_path
+        self._reset()
+
+    def _reset(self):
+        self.files = {}       # path -> {"size", "mtime", "offset", "lines"}
+        self.docs = []        # doc_id -> {"source", "index", "topic", "length"}
+        self.postings = {}    # gram -> {doc_id: 가중 tf}
+        self._total_length = 0.0
+        self.dirty = False
+
+    # --- 저장 / 불러오기 ---
+    def load(self) -> bool:
+        """저장된 색인을 불러옵니다. 버전이나 대상 파일 목록이 다르면 False를 반환합니다."""
+        try:
+            with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != INDEX_VERSION or sorted(data.get("files", {})) != sorted(self.paths):
+            return False
+
+        self.files = data["files"]
+        self.docs = data["docs"]
+        self.postings = {
+            gram: {int(doc_id): tf for doc_id, tf in entries}
+            for gram, entries in data["postings"].items()
+        }
+        self._total_length = sum(doc["length"] for doc in self.docs)
+        self.dirty = False
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        data = {
+            "version": INDEX_VERSION,
+            "files": self.files,
+            "docs": self.docs,
+            "postings": {
+                gram: [[doc_id, round(tf, 3)] for doc_id, tf in entries.items()]
+                for gram, entries in self.postings.items()
+            },
+        }
+        tmp_path = self.index_path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+    # --- 색인 생성 / 갱신 ---
+    def _add_document(self, source: str, index: int, line: str):
+        sample = parse_line(line)
+        weighted_tf = Counter()
+        unigram_tf = Counter()
+        fields = {
+            "prompt": [sample.user_prompt],
+            "expert": [text for pair in sample.expert_pairs for text in pair],
+            "passage": [sample.expected_response],
+        }
+        for field_name, texts in fields.items():
+            weight = FIELD_WEIGHTS[field_name]
+            for text in texts:
+                for gram in char_ngrams(text):
+                    weighted_tf[gram] += weight
+                for ch in char_unigrams(text):
+                    unigram_tf[ch] += weight
+
+        doc_id = len(self.docs)
+        length = float(sum(weighted_tf.values()))
+        self.docs.append({
+            "source": source,
+            "index": index,
+            "topic": _topic_of(sample.user_prompt),
+            "length": length,
+        })
+        self._total_length += length
+        # unigram 키는 길이가 1이므로 n-gram 키와 겹치지 않음 (문서 길이에는 넣지 않음)
+        for gram, tf in (weighted_tf + unigram_tf).items():
+            self.postings.setdefault(gram, {})[doc_id] = tf
+
+    def _index_file_from(self, path: str, offset: int, first_line: int) -> tuple[int, int]:
+        """offset 바이트 이후의 완결된 줄을 색인하고 (새 offset, 다음 줄 번호)를 반환합니다."""
+        line_no = first_line
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # 아직 쓰는 중인 마지막 줄은 다음 갱신 때 처리
+                offset += len(raw)
+                line = raw.decode("utf-8")
+                if line.strip():
+                    try:
+                        self._add_document(os.path.basename(path), line_no, line)
+                    except (ValueError, KeyError, TypeError):
+                        pass  # 깨진 줄은 색인에서 제외 (줄 번호는 유지)
+                line_no += 1
+        return offset, line_no
+
+    def update(self) -> bool:
+        """대상 파일의 변경 사항을 반영합니다. 색인이 바뀌었으면 True를 반환합니다."""
+        changed = False
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            state = self.files.get(path)
+            if state and state["size"] == stat.st_size and state["mtime"] == stat.st_mtime:
+                continue
+
+            if state and stat.st_size >= state["offset"]:
+                # 뒤에 줄이 추가된 경우: 추가된 부분만 색인
+                offset, lines = self._index_file_from(path, state["offset"], state["lines"])
+            elif state:
+                # 파일이 줄어들거나 교체된 경우: 전체 재색인
+                self.rebuild()
+                return True
+            else:
+                offset, lines = self._index_file_from(path, 0, 0)
+
+            self.files[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "offset": offset, "lines": lines}
+            changed = True
+
+        if changed:
+            self.dirty = True
+        return changed
+
+    def rebuild(self):
+        self._reset()
+        self.update()
+        self.dirty = True
+
+    # --- 검색 ---
+    def search(self, query: str, limit: int = 20, source: str | None = None) -> list[SearchHit]:
+        """질의와 관련도가 높은 순서대로 샘플을 반환합니다."""
+        query_grams = query_terms(query)
+        if not query_grams or not self.docs:
+            return []
+
+        n_docs = len(self.docs)
+        avg_length = self._total_length / n_docs if n_docs else 1.0
+        scores = {}
+        for gram in query_grams:
+            entries = self.postings.get(gram)
+            if not entries:
+                continue
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            for doc_id, tf in entries.items():
+                length_norm = 1 - BM25_B + BM25_B * self.docs[doc_id]["length"] / avg_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+
+        hits = []
+        for doc_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            doc = self.docs[doc_id]
+            if source and doc["source"] != source:
+                continue
+            hits.append(SearchHit(source=doc["source"], index=doc["index"], score=score, topic=doc["topic"]))
+            if len(hits) >= limit:
+                break
+        return hits
+
+
+def open_index(paths: list[str], index_path: str) -> NgramSearchIndex:
+    """저장된 색인을 불러와 최신 상태로 갱신하고, 바뀐 부분이 있으면 저장합니다."""
+    index = NgramSearchIndex(paths, index_path)
+    if not index.load():
+        index.rebuild()
+    else:
+        index.update()
+    if index.dirty:
+        try:
+            index.save()
+        except OSError:
+            pass  # 읽기 전용 환경에서는 메모리 색인만 사용
+    return index
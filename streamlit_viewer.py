@@ -4,14 +4,31 @@ import asyncio
 import json
 from openai import AsyncOpenAI, OpenAI
 import os
-import aiohttp
-import requests
 import re
+import glob
+import time
 import logging
+import threading
+import uuid
+import hashlib
+import zlib
+from collections import OrderedDict, deque
+from contextlib import aclosing
 from datetime import datetime
 from dotenv import load_dotenv
-from google.auth import default
-import google.auth.transport.requests
+
+import network_pool
+from ksat_dataset import extract_passage, parse_line, parse_prompt_structure
+from generation_log import configure_logging, dropped_records, log_generation
+from generation_control import (
+    END_REASON_LABELS, FINAL_PASSAGE_REQUEST, GenerationTimeout, RoundBudget, RoundController,
+    SlotLimiter, iterate_with_deadline,
+)
+from endpoint_pool import EndpointLease, EndpointPool, VertexEndpoint, is_retryable_status, load_endpoints
+from expert_memory import ExpertAnswerIndex
+from gemini_conversation import GeminiConversation
+from search_index import open_index
+from usage_metrics import UsageStore, empty_usage, estimate_cost, usage_from_gemini, usage_from_openai
 
 load_dotenv()
 
@@ -25,6 +42,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger("KSAT_Model_Preview")
 
+# 생성 로그 설정: 렌더링을 막지 않도록 큐를 거쳐 별도 스레드에서 기록 (프로세스당 1회 구성)
+# 부하 테스트 등에서 실제 로그와 섞이지 않도록 GENERATION_LOG_DIR 환경변수로 위치를 바꿀 수 있음
+GENERATION_LOG_DIR = os.getenv("GENERATION_LOG_DIR", "logs")
+GENERATION_LOG_MAX_BYTES = 20 * 1024 * 1024
+GENERATION_LOG_BACKUP_COUNT = 10
+# 사고 과정 / 전문가 질의응답 원문을 생성 로그에 남길 비율 (0~1)
+LOG_REASONING_SAMPLE_RATE = float(os.getenv("LOG_REASONING_SAMPLE_RATE", "0.1"))
+configure_logging(GENERATION_LOG_DIR, GENERATION_LOG_MAX_BYTES, GENERATION_LOG_BACKUP_COUNT)
+
 if not os.getenv("GOOGLE_API_KEY"):
     os.environ["GOOGLE_API_KEY"] = st.secrets["GOOGLE_API_KEY"]
 if not os.getenv("OPENAI_API_KEY"):
@@ -114,15 +140,74 @@ h3 {
 
 # --- 설정값 ---
 DATASET_PATH = "Gemini-sft-09-07-val.jsonl"
-# Vertex AI 조정된 모델 설정
-ENDPOINT_ID = "4075215603537805312"  # 사용자 지정 엔드포인트 ID (ksat-exp-09-06-flash)
-PROJECT_ID = "gen-lang-client-0921402604"  # GCP 프로젝트 ID  
-LOCATION = "us-central1"  # 모델이 배포된 리전
-MODEL_ID = "6275144856671092736"  # 실제 모델 ID (ksat-exp-09-06-flash)
-
-# 기존 OpenAI 모델들 (참고용)
-#MODEL_NAME = "ft:gpt-4.1-2025-04-14:ksat-agent:ksat-exp-09-06-large:CCMOwou1"
+# 작가 모델 백엔드별 검증 데이터셋. 백엔드마다 학습한 시스템 프롬프트(전문가 호출 방식, 지문 출력 형식)가 다르므로
+# 다른 백엔드의 샘플을 실행할 때는 그 백엔드 데이터셋의 시스템 프롬프트를 사용합니다.
+WRITER_DATASET_PATHS = {"gemini": DATASET_PATH, "gpt": "GPT-sft-09-06-val.jsonl"}
+# 실행 중 만드는 파일(검색 색인, 전문가 응답)을 두는 위치 (APP_CACHE_DIR 환경변수로 바꿀 수 있음)
+CACHE_DIR = os.getenv("APP_CACHE_DIR", ".cache")
+# 키워드 검색 대상 데이터셋과 색인 저장 위치
+SEARCH_DATASET_PATHS = sorted(glob.glob("Gemini-sft-*.jsonl") + glob.glob("GPT-sft-*.jsonl"))
+SEARCH_INDEX_PATH = os.path.join(CACHE_DIR, "search_index.json.gz")
+# 세션별로 보관할 최근 생성 기록 수 (오래된 기록부터 버림)
+GENERATION_HISTORY_SIZE = 20
+# 생성 1회의 최대 소요 시간(초). 초과하면 진행 중인 호출을 모두 취소합니다.
+GENERATION_DEADLINE_SEC = 600
+# 중지 요청 / 마감 시간을 확인하는 주기(초)
+GENERATION_HEARTBEAT_SEC = 0.5
+# 프로세스 전체의 동시 호출 수 제한 (작가 모델 엔드포인트 / 전문가 모델)
+WRITER_MAX_CONCURRENCY = 8
+EXPERT_MAX_CONCURRENCY = 16
+# 작가 모델 라운드 예산: 최대 라운드 수, 누적 토큰 상한(0이면 제한 없음), 연속 무진전 라운드 허용 수
+AGENT_ROUND_BUDGET = RoundBudget(max_rounds=30, max_total_tokens=400_000, max_stalled_rounds=2)
+# 프롬프트별로 보관할 최근 생성 결과 수
+RESULT_CACHE_SIZE = 256
+# 전문가 응답 재사용: 과거 질의와의 유사도가 이 값 이상이면 전문가 모델을 호출하지 않음 (1보다 크게 주면 끔)
+EXPERT_MEMORY_THRESHOLD = float(os.getenv("EXPERT_MEMORY_THRESHOLD", "0.9"))
+EXPERT_MEMORY_PATH = os.getenv("EXPERT_MEMORY_PATH", os.path.join(CACHE_DIR, "expert_pairs.jsonl"))
+# Vertex AI 조정된 모델 엔드포인트 풀: 같은 모델(ksat-exp-09-06-flash)을 배포한 리전 / 프로젝트별 엔드포인트
+# VERTEX_ENDPOINTS 환경변수(JSON 배열, 항목 형식은 아래와 같고 weight는 선택)로 바꿀 수 있음.
+# 모든 프로젝트에서 같은 서비스 계정 / 사용자 인증으로 호출할 수 있어야 합니다.
+DEFAULT_VERTEX_ENDPOINTS = [
+    {
+        "endpoint_id": "4075215603537805312",  # 사용자 지정 엔드포인트 ID
+        "project_id": "gen-lang-client-0921402604",  # GCP 프로젝트 ID
+        "location": "us-central1",  # 모델이 배포된 리전
+        "model_id": "6275144856671092736",  # 실제 모델 ID
+    },
+]
+VERTEX_ENDPOINTS = load_endpoints(os.getenv("VERTEX_ENDPOINTS") or DEFAULT_VERTEX_ENDPOINTS)
+# 엔드포인트 선택 방식: "latency"(EWMA 지연 × 부하) 또는 "least_loaded"(진행 중인 생성 수)
+ENDPOINT_SELECTION = os.getenv("VERTEX_ENDPOINT_SELECTION", "latency")
+# 연속 실패가 이 횟수 이상이면(429는 즉시) 쿨다운 동안 선택에서 제외
+ENDPOINT_FAILURE_THRESHOLD = 3
+ENDPOINT_COOLDOWN_SEC = 30
+
+# 비교 모드에서 함께 실행하는 OpenAI 조정 모델 (GPT 형식 데이터셋으로 학습, 전문가 질의는 request_for_expert 도구 호출)
+GPT_WRITER_MODEL_NAME = "ft:gpt-4.1-2025-04-14:ksat-agent:ksat-exp-09-06-large:CCMOwou1"
+GPT_WRITER_MAX_CONCURRENCY = 8
+EXPERT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "request_for_expert",
+        "description": "지문 작성에 필요한 정보를 전문가 모델에게 질의합니다.",
+        "parameters": {
+            "type": "object",
+            "properties": {"input": {"type": "string", "description": "전문가에게 보낼 질의"}},
+            "required": ["input"],
+        },
+    },
+}
+# 작가 모델 백엔드 (비교 모드에서는 두 백엔드를 같은 프롬프트로 동시에 실행)
+WRITER_BACKEND_LABELS = {"gemini": "Gemini Flash (Vertex AI)", "gpt": "GPT-4.1 Large (OpenAI)"}
+MODEL_OPTIONS = {
+    "KSAT Psg Flash (Preview 0908)": ["gemini"],
+    "비교: Flash vs Large (GPT 0906)": ["gemini", "gpt"],
+}
 EXPERT_MODEL_NAME = "gemini-2.5-flash"
+# 부하 테스트 등에서 모의 서버로 돌릴 수 있도록 API 주소는 환경변수로 바꿀 수 있음
+EXPERT_BASE_URL = os.getenv("EXPERT_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/")
+VERTEX_API_BASE_URL = os.getenv("VERTEX_API_BASE_URL", "")
+OPENAI_BASE_URL = os.getenv("OPENAI_API_BASE_URL", "https://api.openai.com/v1")
 
 EXPERT_PROMPT = """
 당신은 작가 모델에게 수능 지문을 작성하기 위해 필요한 정보를 제공하는 전문가 모델입니다.
@@ -145,47 +230,22 @@ EXPERT_PROMPT = """
 """
 
 # --- Vertex AI 조정된 모델 호출 함수 ---
+def vertex_api_base_url(location: str) -> str:
+    """리전별 Vertex AI API 주소 (VERTEX_API_BASE_URL이 설정되어 있으면 그 주소)"""
+    return VERTEX_API_BASE_URL.rstrip("/") or f"https://{location}-aiplatform.googleapis.com"
+
+def vertex_service_account_json() -> str | None:
+    """Streamlit Cloud Secrets에 JSON 문자열로 제공되는 서비스 계정 키 (secrets.toml이 없는 로컬 환경이면 None)"""
+    try:
+        return st.secrets.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    except Exception:
+        return None
+
 def get_vertex_ai_credentials():
-    """Vertex AI 인증 토큰을 가져옵니다."""
+    """Vertex AI 인증 토큰을 가져옵니다. (자격 증명은 프로세스 전체에서 캐시, 만료 직전에만 갱신)"""
     try:
-        # 1. Streamlit Cloud Secrets에서 JSON 문자열로 제공되는 서비스 계정 키 처리
-        if hasattr(st, 'secrets') and "GOOGLE_APPLICATION_CREDENTIALS_JSON" in st.secrets:
-            import json
-            from google.oauth2 import service_account
-            
-            try:
-                creds_json = json.loads(st.secrets["GOOGLE_APPLICATION_CREDENTIALS_JSON"])
-                credentials = service_account.Credentials.from_service_account_info(
-                    creds_json, 
-                    scopes=["https://www.googleapis.com/auth/cloud-platform"]
-                )
-                credentials.refresh(google.auth.transport.requests.Request())
-                return credentials.token
-            except Exception as e:
-                st.error(f"Streamlit Secrets 인증 실패: {e}")
-        
-        # 2. 로컬 환경에서 gcloud CLI 인증 시도
-        original_creds = os.environ.pop('GOOGLE_APPLICATION_CREDENTIALS', None)
-        
-        try:
-            credentials, _ = default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
-            credentials.refresh(google.auth.transport.requests.Request())
-            return credentials.token
-        finally:
-            if original_creds:
-                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = original_creds
-                
+        return network_pool.fetch_vertex_ai_token(vertex_service_account_json())
     except Exception as e:
-        # 3. gcloud 인증 실패 시, 환경변수 인증 재시도
-        if 'original_creds' in locals() and original_creds and os.path.exists(original_creds):
-            try:
-                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = original_creds
-                credentials, _ = default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
-                credentials.refresh(google.auth.transport.requests.Request())
-                return credentials.token
-            except Exception as e2:
-                pass
-        
         # 인증 방법 안내
         st.error(f"Vertex AI 인증 실패: {e}")
         with st.expander("🔧 인증 설정 방법", expanded=True):
@@ -214,125 +274,112 @@ def get_vertex_ai_credentials():
             """)
         return None
 
-async def call_vertex_ai_endpoint(endpoint_id: str, project_id: str, location: str, messages: list, temperature: float = 0.7):
-    """Vertex AI 조정된 모델 엔드포인트에 직접 요청을 보냅니다."""
+def vertex_endpoint_url(endpoint_id: str, project_id: str, location: str) -> str:
+    return f"{vertex_api_base_url(location)}/v1/projects/{project_id}/locations/{location}/endpoints/{endpoint_id}:generateContent"
+
+def as_gemini_conversation(messages, temperature: float) -> GeminiConversation:
+    """OpenAI 형식 messages 목록이면 Gemini 형식 대화로 변환합니다. (이미 대화 객체면 그대로)"""
+    if isinstance(messages, GeminiConversation):
+        return messages
+    return GeminiConversation.from_messages(messages, temperature)
+
+def parse_vertex_ai_response(result: dict) -> tuple[str, dict]:
+    """(응답 텍스트, 토큰 사용량). 텍스트가 없는 응답(안전 필터 차단, 빈 MAX_TOKENS 등)은 "[error] ..." 텍스트"""
+    usage = usage_from_gemini(result.get("usageMetadata"))
+    candidates = result.get("candidates") or []
+    if not candidates:
+        return "[error] No response from model", usage
+    try:
+        return candidates[0]["content"]["parts"][0]["text"], usage
+    except (KeyError, IndexError, TypeError):
+        return f"[error] No text in response (finishReason: {candidates[0].get('finishReason')})", usage
+
+async def call_vertex_ai_endpoint(endpoint: VertexEndpoint, messages, temperature: float = 0.7):
+    """Vertex AI 조정된 모델 엔드포인트에 직접 요청을 보냅니다.
+
+    messages는 OpenAI 형식 메시지 목록 또는 GeminiConversation입니다. 대화 객체를 넘기면
+    지난 라운드까지 직렬화해 둔 본문에 새 turn만 덧붙인 것을 그대로 보냅니다.
+    (이 경우 temperature는 대화 객체에 설정된 값을 사용)
+    응답 지연과 재시도할 만한 실패는 엔드포인트 풀에 기록됩니다.
+
+    Returns:
+        (content, usage, retryable): 응답 텍스트, usageMetadata를 정규화한 토큰 사용량,
+        다른 엔드포인트로 다시 보낼 만한 실패(429, 5xx, 연결 실패)인지 여부
+    """
     access_token = get_vertex_ai_credentials()
     if not access_token:
-        return None
+        return None, empty_usage(), False
     
-    # Vertex AI 엔드포인트 URL
-    url = f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/endpoints/{endpoint_id}:generateContent"
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
-    # Gemini API 형식으로 메시지 변환
-    contents = []
-    system_instruction = None
-    
-    for msg in messages:
-        if msg["role"] == "system":
-            system_instruction = msg["content"]
-        elif msg["role"] == "user":
-            contents.append({
-                "role": "user",
-                "parts": [{"text": msg["content"]}]
-            })
-        elif msg["role"] == "assistant":
-            contents.append({
-                "role": "model", 
-                "parts": [{"text": msg["content"]}]
-            })
-    
-    # 요청 페이로드
-    payload = {
-        "contents": contents,
-        "generationConfig": {
-            "temperature": temperature,
-            "maxOutputTokens": 8192,
-        }
-    }
-    
-    if system_instruction:
-        payload["systemInstruction"] = {
-            "parts": [{"text": system_instruction}]
-        }
+    conversation = as_gemini_conversation(messages, temperature)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    pool = get_endpoint_pool()
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    if "candidates" in result and result["candidates"]:
-                        content = result["candidates"][0]["content"]["parts"][0]["text"]
-                        return content
-                    else:
-                        return "[error] No response from model"
-                else:
-                    error_text = await response.text()
-                    return f"[error] HTTP {response.status}: {error_text}"
+        # 공유 연결 풀로 요청 (세션마다 DNS 조회 / TLS 연결을 새로 맺지 않음)
+        async with get_writer_limiter().slot():
+            started = time.perf_counter()
+            status, result = await network_pool.post_body(
+                vertex_endpoint_url(endpoint.endpoint_id, endpoint.project_id, endpoint.location), headers, conversation.body
+            )
+    except network_pool.TRANSPORT_ERRORS as e:
+        # 연결 실패 / 시간 초과만 엔드포인트 장애로 기록하고 다른 엔드포인트로 다시 보냄
+        pool.record_failure(endpoint, None, str(e) or type(e).__name__)
+        return f"[error] Request failed: {e}", empty_usage(), True
     except Exception as e:
-        return f"[error] Request failed: {e}"
+        return f"[error] Request failed: {e}", empty_usage(), False
+
+    if status != 200:
+        retryable = is_retryable_status(status)
+        if retryable:
+            pool.record_failure(endpoint, status, str(result))
+        return f"[error] HTTP {status}: {result}", empty_usage(), retryable
+    # 응답 내용과 무관하게 엔드포인트는 정상 응답한 것이므로 성공으로 기록 (텍스트가 없으면 재시도하지 않는 오류)
+    pool.record_success(endpoint, time.perf_counter() - started)
+    return (*parse_vertex_ai_response(result), False)
+
+# --- OpenAI 조정 모델 호출 함수 (비교 모드) ---
+async def call_gpt_writer(messages: list, temperature: float = 0.7):
+    """OpenAI 조정 모델에 request_for_expert 도구와 함께 요청을 보냅니다.
+
+    Returns:
+        (content, tool_calls, usage): 응답 텍스트(실패하면 "[error] ..."), OpenAI 형식 도구 호출 목록,
+        토큰 사용량
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return "[error] Missing OPENAI_API_KEY", [], empty_usage()
 
-def call_vertex_ai_endpoint_sync(endpoint_id: str, project_id: str, location: str, messages: list, temperature: float = 0.7):
-    """동기식 Vertex AI 조정된 모델 호출"""
-    access_token = get_vertex_ai_credentials()
-    if not access_token:
-        return "[error] Authentication failed"
-    
-    url = f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/endpoints/{endpoint_id}:generateContent"
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
-    # Gemini API 형식으로 메시지 변환
-    contents = []
-    system_instruction = None
-    
-    for msg in messages:
-        if msg["role"] == "system":
-            system_instruction = msg["content"]
-        elif msg["role"] == "user":
-            contents.append({
-                "role": "user",
-                "parts": [{"text": msg["content"]}]
-            })
-        elif msg["role"] == "assistant":
-            contents.append({
-                "role": "model", 
-                "parts": [{"text": msg["content"]}]
-            })
-    
-    payload = {
-        "contents": contents,
-        "generationConfig": {
-            "temperature": temperature,
-            "maxOutputTokens": 8192,
-        }
-    }
-    
-    if system_instruction:
-        payload["systemInstruction"] = {
-            "parts": [{"text": system_instruction}]
-        }
-    
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            if "candidates" in result and result["candidates"]:
-                content = result["candidates"][0]["content"]["parts"][0]["text"]
-                return content
-            else:
-                return "[error] No response from model"
-        else:
-            return f"[error] HTTP {response.status_code}: {response.text}"
+        async with get_gpt_writer_limiter().slot():
+            resp = await network_pool.chat_completion(
+                api_key,
+                OPENAI_BASE_URL,
+                model=GPT_WRITER_MODEL_NAME,
+                messages=messages,
+                tools=[EXPERT_TOOL],
+                temperature=temperature,
+            )
     except Exception as e:
-        return f"[error] Request failed: {e}"
+        return f"[error] Request failed: {e}", [], empty_usage()
+
+    usage = usage_from_openai(resp.usage)
+    if not resp.choices:
+        return "[error] No response from model", [], usage
+    message = resp.choices[0].message
+    tool_calls = [{
+        "id": call.id,
+        "type": "function",
+        "function": {"name": call.function.name, "arguments": call.function.arguments},
+    } for call in message.tool_calls or []]
+    return message.content or "", tool_calls, usage
+
+def expert_question_from_tool_call(tool_call: dict) -> str:
+    """request_for_expert 도구 호출의 {"input": ...} 인자를 꺼냅니다. (형식이 어긋나면 인자 원문)"""
+    arguments = tool_call["function"].get("arguments") or ""
+    try:
+        return str(json.loads(arguments).get("input", "")).strip() or arguments.strip()
+    except (json.JSONDecodeError, AttributeError):
+        return arguments.strip()
 
 # --- 일반 Gemini API 클라이언트 (Expert용) ---
 def create_openai_client(use_vertex_ai: bool = False, project_id: str = "", location: str = "") -> AsyncOpenAI:
@@ -341,7 +388,7 @@ def create_openai_client(use_vertex_ai: bool = False, project_id: str = "", loca
     if api_key:
         return AsyncOpenAI(
             api_key=api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
+            base_url=EXPERT_BASE_URL
         )
     else:
         st.error("GOOGLE_API_KEY 환경변수가 설정되지 않았습니다.")
@@ -354,7 +401,7 @@ def create_sync_openai_client(use_vertex_ai: bool = False, project_id: str = "",
     if api_key:
         return OpenAI(
             api_key=api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
+            base_url=EXPERT_BASE_URL
         )
     else:
         return OpenAI()
@@ -370,82 +417,126 @@ def get_dataset_info(path):
         return 0
 
 @st.cache_data
-def load_sample(index):
-    """지정된 인덱스의 데이터셋 샘플을 로드합니다."""
+def load_sample(index, path=DATASET_PATH):
+    """지정된 인덱스의 데이터셋 샘플을 로드합니다. (Gemini / OpenAI SFT 형식 자동 판별)"""
     try:
-        with open(DATASET_PATH, "r", encoding='utf-8') as f:
-            line = f.readlines()[index]
-            data = json.loads(line)
-            
-            # Gemini 형식에서 시스템 프롬프트, 사용자 프롬프트, 기대 응답 추출
-            system_prompt = ""
-            user_prompt = ""
-            expected_response = ""
-            
-            # systemInstruction에서 시스템 프롬프트 추출
-            if "systemInstruction" in data:
-                system_instruction = data["systemInstruction"]
-                if isinstance(system_instruction, dict) and "parts" in system_instruction:
-                    if system_instruction["parts"] and "text" in system_instruction["parts"][0]:
-                        system_prompt = system_instruction["parts"][0]["text"]
-            
-            # contents에서 user와 model 메시지 추출
-            if "contents" in data:
-                contents = data["contents"]
-                for content in contents:
-                    role = content.get("role", "")
-                    parts = content.get("parts", [])
-                    
-                    if role == "user" and parts and "text" in parts[0]:
-                        if not user_prompt:  # 첫 번째 user 메시지를 사용
-                            user_prompt = parts[0]["text"]
-                    
-                    elif role == "model" and parts and "text" in parts[0]:
-                        expected_response_raw = parts[0]["text"]
-                        # <passage> 태그 내용 추출 또는 전체 내용 사용
-                        if "<passage>" in expected_response_raw and "</passage>" in expected_response_raw:
-                            start = expected_response_raw.find("<passage>") + len("<passage>")
-                            end = expected_response_raw.find("</passage>")
-                            expected_response = expected_response_raw[start:end].strip()
-                        else:
-                            # </think> 이후 내용 추출
-                            if "</think>" in expected_response_raw:
-                                expected_response = expected_response_raw.split("</think>", 1)[1].strip()
-                            else:
-                                expected_response = expected_response_raw.strip()
-            
-            return system_prompt, user_prompt, expected_response
+        with open(path, "r", encoding='utf-8') as f:
+            sample = parse_line(f.readlines()[index])
+        return sample.system_prompt, sample.user_prompt, sample.expected_response
     except Exception as e:
         st.error(f"데이터셋 로딩 오류: {e}")
         return None, None, None
 
+def writer_system_prompt(backend: str, dataset_path: str = "", sample_system_prompt: str = "") -> str:
+    """작가 모델 백엔드에 보낼 시스템 프롬프트. 샘플이 그 백엔드의 데이터셋이면 샘플의 것, 아니면 백엔드 데이터셋의 것"""
+    if sample_system_prompt and dataset_path == WRITER_DATASET_PATHS[backend]:
+        return sample_system_prompt
+    system_prompt, _, _ = load_sample(0, WRITER_DATASET_PATHS[backend])
+    return system_prompt or ""
+
+@st.cache_resource
+def get_search_index():
+    """데이터셋 n-gram 검색 색인을 불러옵니다. (프로세스 전체에서 공유)"""
+    return open_index(SEARCH_DATASET_PATHS, SEARCH_INDEX_PATH), threading.Lock()
+
+def search_samples(query: str, limit: int = 20, source: str | None = None):
+    """키워드로 데이터셋 샘플을 검색합니다. 검색 전에 추가된 줄이 있으면 색인을 갱신합니다."""
+    index, lock = get_search_index()
+    with lock:
+        if index.update():
+            try:
+                index.save()
+            except OSError:
+                pass
+        return index.search(query, limit=limit, source=source)
+
+@st.cache_resource
+def get_writer_limiter():
+    """작가 모델 엔드포인트 동시 호출 제한기 (프로세스 전체에서 공유)"""
+    return SlotLimiter(WRITER_MAX_CONCURRENCY)
+
+@st.cache_resource
+def get_gpt_writer_limiter():
+    """OpenAI 조정 모델(비교 모드의 작가 모델) 동시 호출 제한기 (프로세스 전체에서 공유)"""
+    return SlotLimiter(GPT_WRITER_MAX_CONCURRENCY)
+
+@st.cache_resource
+def get_endpoint_pool():
+    """작가 모델 엔드포인트 풀 (프로세스 전체에서 공유, 엔드포인트별 지연 / 상태 기록 유지)"""
+    return EndpointPool(
+        VERTEX_ENDPOINTS,
+        strategy=ENDPOINT_SELECTION,
+        failure_threshold=ENDPOINT_FAILURE_THRESHOLD,
+        cooldown_sec=ENDPOINT_COOLDOWN_SEC,
+    )
+
+@st.cache_resource
+def get_expert_limiter():
+    """전문가 모델 동시 호출 제한기 (프로세스 전체에서 공유)"""
+    return SlotLimiter(EXPERT_MAX_CONCURRENCY)
+
+@st.cache_resource
+def get_result_cache():
+    """프롬프트별 최근 생성 결과 (프로세스 전체에서 공유, 오래된 항목부터 버림)"""
+    return OrderedDict(), threading.Lock()
+
+def _result_cache_key(system_prompt: str, user_prompt: str) -> str:
+    return hashlib.sha1(f"{system_prompt}\x00{user_prompt}".encode("utf-8")).hexdigest()
+
+def get_cached_result(system_prompt: str, user_prompt: str) -> dict | None:
+    cache, lock = get_result_cache()
+    with lock:
+        return cache.get(_result_cache_key(system_prompt, user_prompt))
+
+def put_cached_result(system_prompt: str, user_prompt: str, result: dict):
+    cache, lock = get_result_cache()
+    key = _result_cache_key(system_prompt, user_prompt)
+    with lock:
+        cache[key] = result
+        cache.move_to_end(key)
+        while len(cache) > RESULT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+@st.cache_resource
+def start_search_index_prewarm():
+    """검색 색인을 백그라운드 스레드에서 미리 불러옵니다. (프로세스당 1회)
+
+    색인을 처음 만들면 수 초가 걸리므로 첫 검색어 입력에서 기다리지 않도록 합니다.
+    그 사이에 검색하면 get_search_index의 캐시 잠금에서 완료를 기다립니다.
+    """
+    thread = threading.Thread(target=get_search_index, name="search-index-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+def prewarm_backends():
+    """토큰 갱신과 Vertex / Gemini 호스트 연결 예열, 검색 색인 로딩을 백그라운드에서 시작합니다. (화면 렌더링을 기다리게 하지 않음)"""
+    start_search_index_prewarm()
+    network_pool.schedule_prewarm(
+        sorted({f"{vertex_api_base_url(endpoint.location)}/" for endpoint in VERTEX_ENDPOINTS}),
+        os.getenv("GOOGLE_API_KEY"),
+        EXPERT_BASE_URL,
+        vertex_service_account_json(),
+    )
+
+@st.cache_resource
+def get_expert_memory():
+    """데이터셋과 이전 실행의 전문가 질의/응답 유사도 색인 (프로세스 전체에서 공유)"""
+    memory = ExpertAnswerIndex(EXPERT_MEMORY_THRESHOLD, persist_path=EXPERT_MEMORY_PATH)
+    memory.load_datasets(SEARCH_DATASET_PATHS)
+    memory.load_persisted()
+    return memory
+
+@st.cache_resource
+def get_usage_store():
+    """토큰 사용량 기록 저장소 (프로세스 전체에서 공유)"""
+    return UsageStore()
+
 def format_text_to_html(text: str) -> str:
     """텍스트의 줄바꿈을 HTML 단락(<p>)으로 변환합니다."""
     paragraphs = text.strip().split('\n')
     html_paragraphs = [f"<p>{p.strip()}</p>" for p in paragraphs if p.strip()]
     return "".join(html_paragraphs)
 
-def parse_prompt_structure(user_prompt: str) -> tuple[str, str, str]:
-    """사용자 프롬프트를 파싱하여 분야, 유형, 주제를 추출합니다."""
-    try:
-        lines = user_prompt.strip().split('\n')
-        field_info = ""
-        type_info = ""
-        topic_info = ""
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith("분야:"):
-                field_info = line.replace("분야:", "").strip()
-            elif line.startswith("유형:"):
-                type_info = line.replace("유형:", "").strip()
-            elif line.startswith("주제:"):
-                topic_info = line.replace("주제:", "").strip()
-        
-        return field_info, type_info, topic_info
-    except Exception:
-        return "파싱 실패", "파싱 실패", "파싱 실패"
-
 def format_prompt_from_components(field: str, type_info: str, topic: str) -> str:
     """분야, 유형, 주제를 결합하여 프롬프트 형식으로 변환합니다."""
     return f"분야: {field}\n유형: {type_info}\n주제: {topic}"
@@ -476,6 +567,79 @@ with st.sidebar:
 
     # 높이 감지는 하지만 표시하지 않음
 
+    # 토큰 사용량 / 처리량 대시보드
+    usage_summary = get_usage_store().summary()
+    st.markdown("### 사용량 지표")
+    if usage_summary["generations"]:
+        st.metric("작가 모델 출력 속도", f"{usage_summary['writer_tokens_per_sec']:.1f} tokens/s")
+        st.metric("지문당 토큰", f"{usage_summary['tokens_per_passage']:,.0f}")
+        st.metric("전문가 호출 비용 비중", f"{usage_summary['expert_cost_share'] * 100:.1f}%")
+        st.caption(
+            f"생성 {usage_summary['generations']}회 (완료 {usage_summary['completed']}회) · "
+            f"입력 {usage_summary['prompt_tokens']:,} (캐시 {usage_summary['cached_tokens']:,}) / "
+            f"출력 {usage_summary['output_tokens']:,} tokens · "
+            f"참고 비용 ${usage_summary['estimated_cost']:.4f}"
+        )
+        st.caption(f"생성 소요 시간 p50 {usage_summary['duration_p50']:.1f}s / p95 {usage_summary['duration_p95']:.1f}s")
+        st.caption("종료 사유: " + " · ".join(
+            f"{END_REASON_LABELS.get(reason, reason)} {count}회" for reason, count in usage_summary["end_reasons"].items()
+        ))
+        st.markdown("**지문당 라운드 수 분포**")
+        st.bar_chart({"생성 횟수": {str(k): v for k, v in usage_summary["rounds_distribution"].items()}})
+        st.markdown("**라운드별 누적 지연(s) / 토큰**")
+        st.dataframe(
+            [{"라운드": r, "호출 수": row["calls"], "지연(s)": round(row["latency"], 2), "토큰": row["total_tokens"]}
+             for r, row in usage_summary["by_round"].items()],
+            hide_index=True,
+        )
+        if len(usage_summary["by_backend"]) > 1:
+            st.markdown("**작가 모델별 지표**")
+            st.dataframe(
+                [{
+                    "모델": WRITER_BACKEND_LABELS.get(backend, backend),
+                    "생성 (완료)": f"{row['generations']} ({row['completed']})",
+                    "출력 속도(tokens/s)": round(row["writer_tokens_per_sec"], 1),
+                    "평균 라운드": round(row["avg_rounds"], 1),
+                    "지문당 토큰": round(row["tokens_per_passage"]),
+                    "소요 p50 / p95(s)": f"{row['duration_p50']:.1f} / {row['duration_p95']:.1f}",
+                    "생성당 비용($)": round(row["cost_per_generation"], 4),
+                } for backend, row in usage_summary["by_backend"].items()],
+                hide_index=True,
+            )
+    else:
+        st.caption("아직 기록된 생성이 없습니다.")
+
+    # 작가 모델 엔드포인트별 상태
+    endpoint_rows = get_endpoint_pool().snapshot()
+    if len(endpoint_rows) > 1 or any(row["successes"] or row["failures"] for row in endpoint_rows):
+        st.markdown("**작가 모델 엔드포인트**")
+        st.dataframe(
+            [{
+                "엔드포인트": row["label"],
+                "상태": "정상" if row["healthy"] else "제외됨",
+                "EWMA 지연(s)": round(row["ewma_latency"], 2) if row["ewma_latency"] is not None else None,
+                "진행 중": row["leases"],
+                "성공 / 실패": f"{row['successes']} / {row['failures']}",
+            } for row in endpoint_rows],
+            hide_index=True,
+        )
+
+    # 전문가 응답 재사용 (유사 질의 색인)
+    memory_stats = get_expert_memory().stats()
+    if memory_stats["lookups"]:
+        st.metric("전문가 응답 재사용률", f"{memory_stats['hit_rate'] * 100:.1f}%")
+        st.caption(
+            f"조회 {memory_stats['lookups']}회 중 {memory_stats['hits']}회 재사용 · "
+            f"절약 시간 약 {memory_stats['latency_saved_sec']:.1f}s "
+            f"(전문가 호출 평균 {memory_stats['avg_expert_latency']:.1f}s, 조회 평균 {memory_stats['avg_lookup_ms']:.2f}ms) · "
+            f"색인 {memory_stats['pairs']}쌍"
+        )
+
+    # 로그 큐가 가득 차서 버려진 레코드 (생성 로그가 빠져 있을 수 있음)
+    dropped_log_records = dropped_records()
+    if dropped_log_records:
+        st.warning(f"로그 큐가 가득 차 기록되지 않은 로그 레코드 {dropped_log_records:,}건")
+
 # --- 메인 페이지 로고 & 타이틀 (상단) ---
 st.markdown(f"""
 <div style="display: flex; justify-content: flex-start; align-items: center; margin-bottom: 20px;">
@@ -509,6 +673,9 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 
+# --- 백그라운드 예열 (페이지 로드 / 샘플 선택 시, 최근 예열 이후 일정 시간이 지났을 때만) ---
+prewarm_backends()
+
 # --- 3컬럼 레이아웃 ---
 col1, col2, col3 = st.columns([1, 1, 1])
 
@@ -519,7 +686,11 @@ with col1:
         # 모델 선택 섹션
         with st.container(border=True):
             st.markdown("**AI 모델 선택**")
-            model_name = st.selectbox("모델명", ["KSAT Psg Flash (Preview 0908)"], index=0)
+            model_name = st.selectbox("모델명", list(MODEL_OPTIONS), index=0, key="model_name")
+            writer_backends = MODEL_OPTIONS[model_name]
+            comparison_mode = len(writer_backends) > 1
+            if comparison_mode:
+                st.caption("같은 프롬프트를 두 작가 모델로 동시에 실행해 나란히 표시하고, 지연 / 라운드 / 토큰을 비교합니다.")
         
         # 입력 프롬프트 섹션
         with st.container(border=True):
@@ -528,17 +699,40 @@ with col1:
             
             with tab1:
                 # 데이터셋 샘플 선택
-                total_samples = get_dataset_info(DATASET_PATH)
+                dataset_path = st.selectbox(
+                    "데이터셋", list(dict.fromkeys(WRITER_DATASET_PATHS.values())), index=0, key="preset_dataset",
+                )
+                total_samples = get_dataset_info(dataset_path)
                 if total_samples > 0:
-                    dataset_index = st.selectbox(
-                        "검증 데이터셋 샘플",
-                        options=range(total_samples),
-                        format_func=lambda x: f"Sample #{x}",
-                        index=0
-                    )
+                    picker_col, search_col = st.columns([1, 1])
+                    with search_col:
+                        search_query = st.text_input("키워드 검색", value="", placeholder="예: 채권", key="preset_search").strip()
+                    
+                    sample_options = list(range(total_samples))
+                    sample_topics = {}
+                    if search_query:
+                        search_started = time.perf_counter()
+                        hits = search_samples(search_query, limit=total_samples, source=os.path.basename(dataset_path))
+                        search_ms = (time.perf_counter() - search_started) * 1000
+                        if hits:
+                            # 검색 결과가 있으면 관련도 순으로 샘플 목록을 좁힘
+                            sample_options = [hit.index for hit in hits]
+                            sample_topics = {hit.index: hit.topic for hit in hits}
+                            st.caption(f"'{search_query}' 검색 결과 {len(hits)}건 ({search_ms:.1f}ms)")
+                        else:
+                            st.caption(f"'{search_query}'와 일치하는 샘플이 없습니다.")
+                    
+                    with picker_col:
+                        dataset_index = st.selectbox(
+                            "검증 데이터셋 샘플",
+                            options=sample_options,
+                            format_func=lambda x: f"Sample #{x} · {sample_topics[x]}" if x in sample_topics else f"Sample #{x}",
+                            index=0,
+                            key="preset_sample",
+                        )
                     
                     # 선택된 샘플 로드 및 파싱
-                    system_prompt, user_prompt, expected_response = load_sample(dataset_index)
+                    system_prompt, user_prompt, expected_response = load_sample(dataset_index, dataset_path)
                     if user_prompt:
                         field_info, type_info, topic_info = parse_prompt_structure(user_prompt)
                         
@@ -552,6 +746,12 @@ with col1:
                             if expected_response:
                                 st.markdown(f'<div class="passage-font">{format_text_to_html(expected_response)}</div>', unsafe_allow_html=True)
                         
+                        # 같은 샘플로 최근에 생성한 결과가 있으면 바로 볼 수 있도록 표시
+                        cached_result = get_cached_result(writer_system_prompt("gemini", dataset_path, system_prompt), user_prompt)
+                        if cached_result:
+                            with st.expander(f"최근 생성 결과 ({cached_result['timestamp']}, Temperature {cached_result['temperature']})", expanded=False):
+                                st.markdown(f'<div class="passage-font">{format_text_to_html(cached_result["passage"])}</div>', unsafe_allow_html=True)
+                        
                         # Preset 탭 실행 버튼
                         preset_run_button = st.button("지문 생성", type="primary", use_container_width=True, key="preset_run")
                     else:
@@ -576,6 +776,12 @@ with col1:
                                           placeholder="여기에 원하는 주제를 입력해주세요.",
                                           key="custom_topic")
                 
+                # 기존 샘플과 주제가 겹치지 않는지 확인할 수 있도록 유사 주제 표시
+                if custom_topic.strip():
+                    similar_hits = search_samples(custom_topic, limit=3, source=os.path.basename(DATASET_PATH))
+                    if similar_hits:
+                        st.caption("유사한 기존 주제: " + " / ".join(f"#{hit.index} {hit.topic}" for hit in similar_hits))
+                
                 # Custom 탭 실행 버튼
                 custom_run_button = st.button("지문 생성", type="primary", use_container_width=True, key="custom_run")
         
@@ -593,51 +799,79 @@ with col1:
             # slider 값이 변경되면 session_state 업데이트
             st.session_state.temperature = temperature
 
-# 두 번째 컬럼: Reasoning & Expert Response
-with col2:
-    st.markdown("#### 2. 모델 사고 과정")
-    with st.container(border=True, height=container_height):
-        reasoning_placeholder = st.empty()
-        reasoning_placeholder.info("AI 모델의 사고 과정이 여기에 표시됩니다.")
-
-# 세 번째 컬럼: Final Response
-with col3:
-    st.markdown("#### 3. 최종 지문")
-    final_placeholder = st.empty()
-    # 커스텀 CSS 컨테이너로 초기 상태 표시
-    final_placeholder.markdown('''
-    <div class="final-response-container">
-        <p style="color: #666; text-align: center; margin-top: 250px;">최종 지문이 여기에 표시됩니다.</p>
-    </div>
-    ''', unsafe_allow_html=True)
+if not comparison_mode:
+    # 두 번째 컬럼: Reasoning & Expert Response
+    with col2:
+        title_col, stop_col = st.columns([3, 1], vertical_alignment="bottom")
+        with title_col:
+            st.markdown("#### 2. 모델 사고 과정")
+        with stop_col:
+            stop_placeholder = st.empty()
+        generation_status_placeholder = st.empty()
+        with st.container(border=True, height=container_height):
+            reasoning_placeholder = st.empty()
+            reasoning_placeholder.info("AI 모델의 사고 과정이 여기에 표시됩니다.")
+
+    # 세 번째 컬럼: Final Response
+    with col3:
+        st.markdown("#### 3. 최종 지문")
+        final_placeholder = st.empty()
+        # 커스텀 CSS 컨테이너로 초기 상태 표시
+        final_placeholder.markdown('''
+        <div class="final-response-container">
+            <p style="color: #666; text-align: center; margin-top: 250px;">최종 지문이 여기에 표시됩니다.</p>
+        </div>
+        ''', unsafe_allow_html=True)
+else:
+    # 비교 모드: 두 번째 / 세 번째 컬럼에 작가 모델별 사고 과정과 최종 지문을 나란히 표시
+    comparison_views = {}  # 백엔드 → (사고 과정, 최종 지문, 진행 상태) 자리
+    for column_idx, (column, backend) in enumerate(zip((col2, col3), writer_backends)):
+        with column:
+            title_col, stop_col = st.columns([3, 1], vertical_alignment="bottom")
+            with title_col:
+                st.markdown(f"#### {column_idx + 2}. {WRITER_BACKEND_LABELS[backend]}")
+            if column_idx == 0:
+                with stop_col:
+                    stop_placeholder = st.empty()
+            backend_status_placeholder = st.empty()
+            with st.container(border=True, height=container_height // 2):
+                backend_reasoning_placeholder = st.empty()
+                backend_reasoning_placeholder.info("이 모델의 사고 과정이 여기에 표시됩니다.")
+            backend_final_placeholder = st.empty()
+            backend_final_placeholder.markdown('''
+            <div class="final-response-container">
+                <p style="color: #666; text-align: center; margin-top: 100px;">최종 지문이 여기에 표시됩니다.</p>
+            </div>
+            ''', unsafe_allow_html=True)
+            comparison_views[backend] = (backend_reasoning_placeholder, backend_final_placeholder, backend_status_placeholder)
 
 
 # --- 도구 함수 (전문가 호출) ---
-async def execute_request_for_expert(input_text: str) -> str:
+async def execute_request_for_expert(input_text: str) -> tuple[str, dict]:
+    """전문가 모델에 질의하고 (응답 텍스트, 토큰 사용량)을 반환합니다."""
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
-        return "[expert_error] Missing GOOGLE_API_KEY"
+        return "[expert_error] Missing GOOGLE_API_KEY", empty_usage()
 
-    def _call_sync() -> str:
-        try:
-            # Expert 모델은 항상 Google API 사용 (Gemini)
-            client = OpenAI(
-                api_key=api_key,
-                base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-            )
-            resp = client.chat.completions.create(
+    # 스레드(asyncio.to_thread)에 넘긴 호출은 취소할 수 없으므로 비동기 클라이언트 사용
+    try:
+        async with get_expert_limiter().slot():
+            # Expert 모델은 항상 Google API 사용 (Gemini), 공유 연결 풀의 클라이언트로 호출
+            resp = await network_pool.chat_completion(
+                api_key,
+                EXPERT_BASE_URL,
                 model=EXPERT_MODEL_NAME,
                 messages=[
                     {"role": "system", "content": EXPERT_PROMPT},
                     {"role": "user", "content": input_text},
                 ],
             )
-            return resp.choices[0].message.content if resp.choices else ""
-        except Exception as e:
-            return f"[expert_error] {e}"
+        result = resp.choices[0].message.content if resp.choices else ""
+        usage = usage_from_openai(resp.usage)
+    except Exception as e:
+        result, usage = f"[expert_error] {e}", empty_usage()
 
-    result = await asyncio.to_thread(_call_sync)
-    return result or "[expert_empty]"
+    return result or "[expert_empty]", usage
 
 
 # --- 텍스트에서 expert 태그 파싱 함수 ---
@@ -673,37 +907,92 @@ def parse_expert_calls(text: str) -> tuple[str, list[str]]:
     
     return cleaned_text, expert_calls
 
+# --- 전문가 질의 처리 (두 작가 모델 백엔드가 공유) ---
+async def answer_expert_questions(controller: RoundController, round_idx: int, questions: list[str]):
+    """작가 모델의 전문가 질의에 차례로 답하며 이벤트를 생성합니다.
+
+    이번 생성에서 이미 한 질의 → 과거의 거의 같은 질의 → 전문가 모델 호출 순으로 응답을 찾습니다.
+    질의마다 tool_start, (notice / usage), tool_output 이벤트를 내며, tool_output의 repeated는
+    이번 생성의 이전 응답을 다시 쓴 경우(진전으로 보지 않음) True입니다.
+    """
+    for call_idx, expert_input in enumerate(questions):
+        # 같은 질문이 반복되어도 구분할 수 있도록 라운드-순번으로 호출 ID 부여
+        call_id = f"{round_idx}-{call_idx}"
+        
+        # 전문가 질의 시작 이벤트 (질의 내용 먼저 표시)
+        yield {"type": "tool_start", "input": expert_input, "call_id": call_id}
+        
+        # 이번 생성에서 이미 한 질의는 다시 호출하지 않고 이전 응답을 재사용
+        expert_result = controller.cached_expert_answer(expert_input)
+        repeated = expert_result is not None
+        if not repeated:
+            # 과거에 거의 같은 질의가 있었으면 저장된 응답을 사용
+            match = get_expert_memory().lookup(expert_input)
+            if match is not None:
+                expert_result = match.answer
+                yield {"type": "notice", "content": f"비슷한 이전 질의(유사도 {match.similarity:.2f})의 응답을 재사용했습니다."}
+            else:
+                # 전문가 함수 호출 (일반 Gemini API 사용)
+                call_started = time.perf_counter()
+                expert_result, usage = await execute_request_for_expert(expert_input)
+                latency = time.perf_counter() - call_started
+                yield {"type": "usage", "source": "expert", "round": round_idx, "latency": latency, **usage}
+                controller.add_usage(usage)
+                if not expert_result.startswith("[expert_"):
+                    get_expert_memory().add(expert_input, expert_result)
+                    get_expert_memory().observe_expert_call(latency)
+            controller.remember_expert_answer(expert_input, expert_result)
+        else:
+            yield {"type": "notice", "content": "이미 한 질의와 같아 이전 응답을 재사용했습니다."}
+        
+        # 스트리밍으로 전문가 응답 표시
+        yield {"type": "tool_output", "content": expert_result, "input": expert_input, "call_id": call_id, "repeated": repeated}
+
 # --- 새로운 스트리밍 함수 (Vertex AI 조정된 모델 기반) ---
-async def run_vertex_ai_flow_streaming(endpoint_id: str, project_id: str, location: str, system_prompt: str, user_prompt: str, temperature: float):
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ]
+async def run_vertex_ai_flow_streaming(system_prompt: str, user_prompt: str, temperature: float, budget: RoundBudget = AGENT_ROUND_BUDGET):
+    """풀에서 작가 모델 엔드포인트 하나를 점유해 생성이 끝날 때까지 같은 엔드포인트로 라운드를 진행합니다."""
+    lease = EndpointLease(get_endpoint_pool())
+    try:
+        async with aclosing(run_writer_rounds(lease, system_prompt, user_prompt, temperature, budget)) as events:
+            async for event in events:
+                yield event
+    finally:
+        lease.release()
+
+async def run_writer_rounds(lease: EndpointLease, system_prompt: str, user_prompt: str, temperature: float, budget: RoundBudget):
+    # 라운드마다 새 turn만 직렬화해 덧붙이는 대화 (요청 본문 구성 비용이 대화 길이와 무관)
+    conversation = GeminiConversation(system_prompt, temperature)
+    conversation.append("user", user_prompt)
 
-    round_idx = 0
+    # 라운드 / 토큰 예산과 진전 여부를 추적하는 제어기
+    controller = RoundController(budget)
     final_text = ""
 
-    while True:
-        round_idx += 1
-        if round_idx > 30:
-            break
+    while controller.start_round():
+        round_idx = controller.rounds
 
         try:
-            # Vertex AI 조정된 모델 호출
-            content = await call_vertex_ai_endpoint(
-                endpoint_id=endpoint_id,
-                project_id=project_id,
-                location=location,
-                messages=messages,
-                temperature=temperature
-            )
+            # Vertex AI 조정된 모델 호출 (재시도할 만한 실패면 다른 엔드포인트로 옮겨 같은 라운드를 다시 보냄)
+            tried_endpoints = set()
+            while True:
+                endpoint = lease.endpoint
+                call_started = time.perf_counter()
+                content, usage, retryable = await call_vertex_ai_endpoint(endpoint, conversation)
+                yield {"type": "usage", "source": "writer", "backend": "gemini", "round": round_idx, "endpoint": endpoint.name,
+                       "latency": time.perf_counter() - call_started, **usage}
+                controller.add_usage(usage)
+                tried_endpoints.add(endpoint)
+                if not (retryable and lease.failover(tried_endpoints)):
+                    break
+                yield {"type": "notice", "content": f"{endpoint.label} 엔드포인트 호출 실패로 {lease.endpoint.label}(으)로 전환합니다."}
             
             if not content or content.startswith("[error]"):
                 yield {"type": "think", "content": f"Model error: {content}"}
+                controller.end_reason = "model_error"
                 break
             
             # assistant 메시지를 히스토리에 추가
-            messages.append({"role": "assistant", "content": content})
+            conversation.append("assistant", content)
             
             # <expert> 태그 파싱
             cleaned_text, expert_calls = parse_expert_calls(content)
@@ -744,54 +1033,55 @@ async def run_vertex_ai_flow_streaming(endpoint_id: str, project_id: str, locati
                 if remaining_text and not has_passage:
                     yield {"type": "think", "content": remaining_text}
                 
-                for expert_input in expert_calls:
-                    # 전문가 질의 시작 이벤트 (질의 내용 먼저 표시)
-                    yield {"type": "tool_start", "input": expert_input}
-                    
-                    # 전문가 함수 호출 (일반 Gemini API 사용)
-                    expert_result = await execute_request_for_expert(expert_input)
-                    
-                    # user 메시지로 전문가 결과 추가
-                    messages.append({
-                        "role": "user",
-                        "content": expert_result
-                    })
-                    
-                    # 스트리밍으로 전문가 응답 표시
-                    yield {"type": "tool_output", "content": expert_result, "input": expert_input}
+                new_expert_calls = 0
+                async with aclosing(answer_expert_questions(controller, round_idx, expert_calls)) as expert_events:
+                    async for event in expert_events:
+                        if event["type"] == "tool_output":
+                            # user 메시지로 전문가 결과 추가
+                            conversation.append("user", event["content"])
+                            new_expert_calls += not event["repeated"]
+                        yield event
                 
                 # <passage> 태그가 있으면 최종 응답으로 처리하고 종료
                 if has_passage and remaining_text:
-                    yield {"type": "final", "content": remaining_text}
+                    controller.finish_with_passage()
+                    final_text = remaining_text
                     break
                 else:
-                    # expert 호출 후 다음 라운드로 계속
-                    continue
+                    # expert 호출 후 진전 여부를 확인하고 다음 라운드로 계속
+                    action = controller.observe_round(content, new_expert_calls)
                     
             else:
                 # expert 호출이 없는 경우
                 if has_passage and remaining_text:
                     # <passage> 태그가 있으면 최종 응답으로 처리하고 종료
-                    yield {"type": "final", "content": remaining_text}
+                    controller.finish_with_passage()
+                    final_text = remaining_text
                     break
                 elif remaining_text:
-                    # 일반 텍스트가 있으면 thinking으로 처리하고 계속
+                    # 일반 텍스트가 있으면 thinking으로 처리 (사고만 있는 라운드)
                     yield {"type": "think", "content": remaining_text}
-                    continue
-                else:
-                    # 아무 텍스트가 없으면 다음 라운드로
-                    continue
+                # 아무 텍스트가 없거나 사고만 있는 라운드는 진전이 없는 것으로 판단
+                action = controller.observe_round(content, 0)
+            
+            if action == "request_final":
+                conversation.append("user", FINAL_PASSAGE_REQUEST)
+                yield {"type": "notice", "content": f"{END_REASON_LABELS[controller.end_reason]}: 최종 지문 작성을 요청합니다."}
+            elif action == "stop":
+                break
                 
         except Exception as e:
             yield {"type": "think", "content": f"[error] {e}"}
+            controller.end_reason = "error"
             break
 
+    yield {"type": "end", "reason": controller.end_reason, "rounds": controller.rounds}
+    if final_text:
+        yield {"type": "final", "content": final_text}
+
     # 최종 텍스트 결정
     if not final_text:
-        for msg in reversed(messages):
-            if msg.get("role") == "assistant" and msg.get("content"):
-                final_text = msg["content"]
-                break
+        final_text = conversation.last_text("assistant")
     
     # 혹시 빈 final response 방지
     if not final_text:
@@ -799,6 +1089,100 @@ async def run_vertex_ai_flow_streaming(endpoint_id: str, project_id: str, locati
 
 
 
+# --- 비교 모드 스트리밍 함수 (OpenAI 조정 모델 기반) ---
+THINK_TAG_PATTERN = re.compile(r"</?think>")
+
+def split_gpt_response(text: str) -> tuple[str, str]:
+    """도구 호출이 없는 GPT 응답을 (사고 과정, 최종 지문)으로 나눕니다. 지문이 없으면 최종 지문은 빈 문자열"""
+    if "<passage>" in text and "</passage>" in text:
+        before = text[:text.find("<passage>")]
+    elif "</think>" in text:
+        before = text[:text.find("</think>")]
+    elif "<think>" in text:
+        # 사고 과정만 있고 끝나지 않은 응답
+        return THINK_TAG_PATTERN.sub("", text).strip(), ""
+    else:
+        return "", text.strip()
+    return THINK_TAG_PATTERN.sub("", before).strip(), extract_passage(text)
+
+async def run_gpt_flow_streaming(system_prompt: str, user_prompt: str, temperature: float, budget: RoundBudget = AGENT_ROUND_BUDGET):
+    """OpenAI 조정 모델로 같은 라운드 흐름을 진행합니다. (이벤트 형식은 run_vertex_ai_flow_streaming과 동일)
+
+    GPT 형식 데이터셋처럼 전문가 질의는 request_for_expert 도구 호출로, 전문가 응답은 tool 메시지로
+    주고받습니다. 도구 호출이 없는 응답의 </think> 이후(또는 <passage> 안) 내용을 최종 지문으로 봅니다.
+    """
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+    controller = RoundController(budget)
+    final_text = ""
+
+    while controller.start_round():
+        round_idx = controller.rounds
+
+        try:
+            call_started = time.perf_counter()
+            content, tool_calls, usage = await call_gpt_writer(messages, temperature)
+            yield {"type": "usage", "source": "writer", "backend": "gpt", "round": round_idx, "model": GPT_WRITER_MODEL_NAME,
+                   "latency": time.perf_counter() - call_started, **usage}
+            controller.add_usage(usage)
+
+            if content.startswith("[error]") or not (content or tool_calls):
+                yield {"type": "think", "content": f"Model error: {content}"}
+                controller.end_reason = "model_error"
+                break
+
+            assistant_message = {"role": "assistant", "content": content}
+            if tool_calls:
+                assistant_message["tool_calls"] = tool_calls
+            messages.append(assistant_message)
+
+            if tool_calls:
+                # 도구 호출이 있으면 응답 텍스트는 사고 과정
+                thinking = THINK_TAG_PATTERN.sub("", content).strip()
+                if thinking:
+                    yield {"type": "think", "content": thinking}
+
+                new_expert_calls = 0
+                tool_call_ids = iter([call["id"] for call in tool_calls])
+                questions = [expert_question_from_tool_call(call) for call in tool_calls]
+                async with aclosing(answer_expert_questions(controller, round_idx, questions)) as expert_events:
+                    async for event in expert_events:
+                        if event["type"] == "tool_output":
+                            # 도구 호출마다 tool 메시지로 전문가 결과 추가
+                            messages.append({"role": "tool", "tool_call_id": next(tool_call_ids), "content": event["content"]})
+                            new_expert_calls += not event["repeated"]
+                        yield event
+                action = controller.observe_round(content, new_expert_calls)
+            else:
+                thinking, passage = split_gpt_response(content)
+                if thinking:
+                    yield {"type": "think", "content": thinking}
+                if passage:
+                    controller.finish_with_passage()
+                    final_text = passage
+                    break
+                # 사고만 있는 라운드는 진전이 없는 것으로 판단
+                action = controller.observe_round(content, 0)
+
+            if action == "request_final":
+                messages.append({"role": "user", "content": FINAL_PASSAGE_REQUEST})
+                yield {"type": "notice", "content": f"{END_REASON_LABELS[controller.end_reason]}: 최종 지문 작성을 요청합니다."}
+            elif action == "stop":
+                break
+
+        except Exception as e:
+            yield {"type": "think", "content": f"[error] {e}"}
+            controller.end_reason = "error"
+            break
+
+    # 종료 이벤트는 한 번만, 지문이 있으면 그 뒤에 전달
+    yield {"type": "end", "reason": controller.end_reason, "rounds": controller.rounds}
+    if final_text:
+        yield {"type": "final", "content": final_text}
+
+# 작가 모델 백엔드 → 스트리밍 함수
+WRITER_FLOWS = {"gemini": run_vertex_ai_flow_streaming, "gpt": run_gpt_flow_streaming}
+
+
 # --- 타이핑 효과 함수 ---
 async def typing_effect(text: str, placeholder, is_final: bool = False):
     """텍스트를 토큰 단위로 타이핑 효과를 내며 표시"""
@@ -828,93 +1212,362 @@ async def typing_effect(text: str, placeholder, is_final: bool = False):
     if not is_final:
         placeholder.markdown(displayed_text.strip())
 
+# --- 생성 기록 (세션별 링 버퍼) ---
+def record_generation_history(generation_id: str, user_prompt: str, events: list, final_content: str, status: str, rounds: int, duration: float,
+                              backend: str = "gemini"):
+    """생성 과정을 압축해 세션 기록에 추가합니다. 요약 정보만 압축하지 않고 보관합니다."""
+    history = st.session_state.setdefault("generation_history", deque(maxlen=GENERATION_HISTORY_SIZE))
+    _, _, topic = parse_prompt_structure(user_prompt)
+    payload = json.dumps({"events": events, "final": final_content}, ensure_ascii=False).encode("utf-8")
+    history.append({
+        "generation_id": generation_id,
+        "timestamp": datetime.now().strftime("%H:%M:%S"),
+        "topic": topic or user_prompt.strip()[:40],
+        "backend": backend,
+        "status": status,
+        "rounds": rounds,
+        "expert_calls": sum(1 for e in events if e.get("type") == "tool_output"),
+        "passage_chars": len(final_content),
+        "duration": round(duration, 1),
+        "blob": zlib.compress(payload, 6),
+    })
+
+def load_generation_history_entry(entry: dict) -> dict:
+    return json.loads(zlib.decompress(entry["blob"]).decode("utf-8"))
+
+def render_event_log(events: list, final_content: str):
+    """기록된 이벤트를 타이핑 효과 없이 한 번에 표시합니다."""
+    for event in events:
+        etype = event.get("type")
+        if etype == "think" and event.get("content"):
+            st.markdown("#### 작가 모델의 사고 과정")
+            st.markdown(event["content"])
+        elif etype == "tool_start":
+            st.markdown("#### 전문가 모델에게 질의하기")
+            with st.expander("질문 내용", expanded=False):
+                st.markdown(event.get("input") or "")
+        elif etype == "tool_output":
+            with st.expander("응답 내용", expanded=False):
+                st.markdown(event.get("content") or "")
+        elif etype == "notice":
+            st.caption(event.get("content") or "")
+    if final_content:
+        st.markdown("#### 최종 지문")
+        st.markdown(f'<div class="passage-font">{format_text_to_html(final_content)}</div>', unsafe_allow_html=True)
+
+def render_generation_history():
+    """요약 행만 표시하고, 선택한 기록 하나만 압축을 풀어 전체 과정을 표시합니다."""
+    history = st.session_state.get("generation_history")
+    if not history:
+        return
+    entries = list(reversed(history))  # 최신 기록이 위로
+    
+    st.markdown("#### 생성 기록")
+    st.dataframe(
+        [{
+            "시각": e["timestamp"], "모델": WRITER_BACKEND_LABELS[e.get("backend", "gemini")], "주제": e["topic"],
+            "상태": e["status"], "라운드": e["rounds"],
+            "전문가 호출": e["expert_calls"], "지문 길이": e["passage_chars"], "소요(s)": e["duration"],
+        } for e in entries],
+        hide_index=True,
+    )
+    entry_by_id = {e["generation_id"]: e for e in entries}
+    selected_id = st.selectbox(
+        "자세히 볼 기록",
+        options=[None] + list(entry_by_id),
+        format_func=lambda gid: "선택 안 함" if gid is None else (
+            f"{entry_by_id[gid]['timestamp']} · {WRITER_BACKEND_LABELS[entry_by_id[gid].get('backend', 'gemini')]} · {entry_by_id[gid]['topic']}"
+        ),
+        key="history_selected_id",
+    )
+    if selected_id:
+        run = load_generation_history_entry(entry_by_id[selected_id])
+        with st.container(border=True):
+            render_event_log(run["events"], run["final"])
+
+# --- 구조화된 생성 로그 ---
+def write_generation_log(generation_id: str, user_prompt: str, log_context: dict | None, status: str, end_reason: str | None,
+                         rounds: int, duration: float, final_elapsed: float | None, usage_calls: list, events: list, final_content: str,
+                         backend: str = "gemini"):
+    """생성 1회를 JSON 레코드 하나로 기록합니다. (직렬화와 파일 쓰기는 로그 스레드에서 처리)"""
+    field_info, type_info, topic_info = parse_prompt_structure(user_prompt)
+    writer_calls = [c for c in usage_calls if c.get("source") == "writer"]
+    expert_calls = [c for c in usage_calls if c.get("source") == "expert"]
+    # 장애 조치로 엔드포인트가 바뀐 경우를 위해 사용한 순서대로 모두 기록
+    endpoints_used = list(dict.fromkeys(c["endpoint"] for c in writer_calls if c.get("endpoint")))
+    endpoint_by_name = {endpoint.name: endpoint for endpoint in VERTEX_ENDPOINTS}
+    last_endpoint = endpoint_by_name.get(endpoints_used[-1]) if endpoints_used else None
+    if backend == "gpt":
+        model = GPT_WRITER_MODEL_NAME
+    else:
+        model = last_endpoint.model_id if last_endpoint else None
+    record = {
+        "generation_id": generation_id,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "backend": backend,
+        "model": model,
+        "endpoints": endpoints_used,
+        **(log_context or {}),
+        "field": field_info,
+        "type": type_info,
+        "topic": topic_info,
+        "user_prompt": user_prompt,
+        "temperature": temperature,
+        "status": status,
+        "end_reason": end_reason,
+        "rounds": rounds,
+        "expert_calls": len(expert_calls),
+        "timings": {
+            "total_sec": round(duration, 3),
+            "to_final_sec": round(final_elapsed, 3) if final_elapsed is not None else None,
+            "writer_sec": round(sum(c.get("latency", 0.0) for c in writer_calls), 3),
+            "expert_sec": round(sum(c.get("latency", 0.0) for c in expert_calls), 3),
+        },
+        "tokens": {
+            key: sum(c.get(key, 0) for c in usage_calls)
+            for key in ("prompt_tokens", "cached_tokens", "output_tokens", "total_tokens")
+        },
+        "final_passage": final_content,
+    }
+    # 사고 과정과 전문가 질의응답 원문은 양이 많으므로 표본으로만 기록
+    # (tool_output에는 질의(input)도 함께 실려 있으므로 응답(content)을 기록)
+    reasoning = [
+        f"[{e['type']}] {(e.get('input') if e['type'] == 'tool_start' else e.get('content')) or ''}"
+        for e in events if e.get("type") in ("think", "tool_start", "tool_output")
+    ]
+    log_generation(record, reasoning, LOG_REASONING_SAMPLE_RATE)
+
 # --- 스트리밍 실행 로직 ---
-async def stream_and_render(final_user_prompt: str, selected_system_prompt: str):
-    # 스트리밍 시작
-    st.session_state["is_streaming"] = True
+def new_generation_run(backend: str) -> dict:
+    """생성 1회의 진행 상태 (화면 렌더링과 기록이 함께 사용)"""
+    return {
+        "generation_id": uuid.uuid4().hex[:12],
+        "backend": backend,
+        "started": time.perf_counter(),
+        # 호출별 토큰 사용량을 생성 ID / 라운드와 함께 기록
+        "usage_calls": [],
+        # 시간순으로 모든 이벤트를 저장 (생성 기록용)
+        "events": [],
+        "final": "",
+        "status": "미완료",
+        "end_reason": None,
+        "final_elapsed": None,
+    }
+
+async def render_generation(run: dict, final_user_prompt: str, selected_system_prompt: str, log_context: dict | None,
+                            reasoning_target, final_target, status_target):
+    """작가 모델 흐름 하나를 실행하며 이벤트를 화면에 그리고, 어떻게 끝나든(중지 / 오류 포함) 기록을 남깁니다."""
+    usage_calls = run["usage_calls"]
+    all_events = run["events"]
+    logger.info(f"지문 생성 시작: {run['generation_id']} ({(log_context or {}).get('mode', '-')}, {run['backend']})")
     
     try:
-        # 시간순으로 모든 이벤트를 저장
-        all_events = []
-        final_content = ""
-        
-        # Vertex AI 설정값 사용
-        endpoint_id = ENDPOINT_ID
-        project_id = PROJECT_ID
-        location = LOCATION
-        
         # 동적으로 섹션을 추가할 메인 컨테이너
-        with reasoning_placeholder.container():
+        with reasoning_target.container():
             reasoning_main = st.container()
             
-        expert_containers = {}  # 전문가 질의별 메인 컨테이너 저장
+        expert_containers = {}  # 전문가 호출 ID별 메인 컨테이너 저장
+        
+        def show_progress():
+            # 이벤트가 없는 동안에도 주기적으로 화면을 갱신해 중지 요청이 바로 반영되도록 함
+            elapsed = time.perf_counter() - run["started"]
+            rounds_so_far = max((call["round"] for call in usage_calls), default=0)
+            status_target.caption(f"생성 중... {elapsed:.0f}초 경과 · 라운드 {rounds_so_far}")
         
-        async for event in run_vertex_ai_flow_streaming(
-            endpoint_id=endpoint_id,
-            project_id=project_id,
-            location=location,
+        flow = WRITER_FLOWS[run["backend"]](
             system_prompt=selected_system_prompt,
             user_prompt=final_user_prompt,
             temperature=temperature,
-        ):
-            etype = event.get("type")
-            
-            if etype == "think":
-                # 작가 모델 사고 과정 - 타이핑 효과 적용
-                think_content = event.get("content", "").strip()
-                if think_content:
+        )
+        async with aclosing(iterate_with_deadline(flow, GENERATION_DEADLINE_SEC, GENERATION_HEARTBEAT_SEC, show_progress)) as events:
+            async for event in events:
+                etype = event.get("type")
+                
+                if etype == "usage":
+                    usage_calls.append({k: v for k, v in event.items() if k != "type"})
+                    continue
+                
+                all_events.append(event)
+                
+                if etype == "end":
+                    run["end_reason"] = event.get("reason")
+                
+                elif etype == "notice":
+                    # 라운드 제어 안내 (중복 질의 재사용, 최종 지문 요청 등)
                     with reasoning_main:
-                        st.markdown("#### 작가 모델의 사고 과정")
-                        thinking_placeholder = st.empty()
+                        st.caption(event.get("content", ""))
+                
+                elif etype == "think":
+                    # 작가 모델 사고 과정 - 타이핑 효과 적용
+                    think_content = event.get("content", "").strip()
+                    if think_content:
+                        with reasoning_main:
+                            st.markdown("#### 작가 모델의 사고 과정")
+                            thinking_placeholder = st.empty()
                     
-                    # 타이핑 효과로 표시
-                    await typing_effect(think_content, thinking_placeholder, is_final=False)
-            
-            elif etype == "tool_start":
-                # 전문가 질의 시작 - 질의 내용만 먼저 표시
-                input_text = (event.get("input") or "").strip()
+                        # 타이핑 효과로 표시
+                        await typing_effect(think_content, thinking_placeholder, is_final=False)
                 
-                with reasoning_main:
-                    expert_section = st.container()
-                    with expert_section:
-                        st.markdown("#### 전문가 모델에게 질의하기")
+                elif etype == "tool_start":
+                    # 전문가 질의 시작 - 질의 내용만 먼저 표시
+                    input_text = (event.get("input") or "").strip()
+                
+                    with reasoning_main:
+                        expert_section = st.container()
+                        with expert_section:
+                            st.markdown("#### 전문가 모델에게 질의하기")
                         
-                        # 질의 내용만 표시
-                        with st.expander("질문 내용", expanded=False):
-                            st.markdown(input_text)
+                            # 질의 내용만 표시
+                            with st.expander("질문 내용", expanded=False):
+                                st.markdown(input_text)
                     
-                    # 이 섹션을 저장해두어서 나중에 응답을 추가할 수 있도록 함
-                    expert_containers[input_text] = expert_section
-            
-            elif etype == "tool_output":
-                # 전문가 응답 완료 - 응답 익스팬더를 새로 생성
-                out_text = (event.get("content") or "").strip()
-                input_text = (event.get("input") or "").strip()
+                        # 이 섹션을 저장해두어서 나중에 응답을 추가할 수 있도록 함
+                        expert_containers[event.get("call_id")] = expert_section
                 
-                # 해당 질의에 대한 컨테이너 찾아서 응답 추가
-                if input_text in expert_containers:
-                    with expert_containers[input_text]:
-                        # 응답 내용 익스팬더를 새로 생성
-                        with st.expander("응답 내용", expanded=False):
-                            st.markdown(out_text)
-            
-            elif etype == "final":
-                # 최종 응답 - 타이핑 효과 적용
-                final_content = event.get("content", "").strip()
-                if final_content:
-                    await typing_effect(final_content, final_placeholder, is_final=True)
-                    # 최종 지문 로깅
-                    logger.info(f"=== 최종 지문 생성 완료 ===")
-                    logger.info(f"생성된 지문 (길이: {len(final_content)}자):\n{final_content}")
-                    logger.info(f"=" * 50)
-                break
+                elif etype == "tool_output":
+                    # 전문가 응답 완료 - 응답 익스팬더를 새로 생성
+                    out_text = (event.get("content") or "").strip()
+                
+                    # 해당 질의에 대한 컨테이너 찾아서 응답 추가
+                    if event.get("call_id") in expert_containers:
+                        with expert_containers[event.get("call_id")]:
+                            # 응답 내용 익스팬더를 새로 생성
+                            with st.expander("응답 내용", expanded=False):
+                                st.markdown(out_text)
+                
+                elif etype == "final":
+                    # 최종 응답 - 타이핑 효과 적용
+                    final_content = event.get("content", "").strip()
+                    if final_content:
+                        run["final"] = final_content
+                        run["final_elapsed"] = time.perf_counter() - run["started"]
+                        await typing_effect(final_content, final_target, is_final=True)
+                        run["status"] = "완료"
+                        # 최근 생성 결과는 서비스 중인 작가 모델(Gemini)의 것만 보관
+                        if run["backend"] == "gemini":
+                            put_cached_result(selected_system_prompt, final_user_prompt, {
+                                "passage": final_content,
+                                "timestamp": datetime.now().strftime("%m-%d %H:%M"),
+                                "temperature": temperature,
+                                "generation_id": run["generation_id"],
+                            })
+                    break
+        
+        if run["status"] != "완료" and run["end_reason"]:
+            # 지문 없이 끝난 경우 종료 사유 표시
+            run["status"] = END_REASON_LABELS.get(run["end_reason"], run["end_reason"])
+            status_target.warning(f"지문 없이 종료되었습니다: {run['status']}")
+        else:
+            status_target.empty()
 
+    except GenerationTimeout as e:
+        run["status"] = "시간 초과"
+        status_target.warning(f"생성을 중단했습니다: {e}")
     except Exception as e:
-        st.error(f"모델 호출 또는 스트리밍 중 오류 발생: {e}")
+        run["status"] = "오류"
+        status_target.error(f"모델 호출 또는 스트리밍 중 오류 발생: {e}")
+    except BaseException:
+        # 중지 버튼 / 페이지 이탈로 인한 스크립트 중단 (진행 중인 호출은 이미 취소됨)
+        run["status"] = "중지됨"
+        raise
+    finally:
+        finish_generation_run(run, final_user_prompt, log_context)
+
+def finish_generation_run(run: dict, final_user_prompt: str, log_context: dict | None):
+    """생성 1회를 세션 기록, 사용량 저장소, 생성 로그에 남깁니다."""
+    status = run["status"]
+    duration = time.perf_counter() - run["started"]
+    end_reason = run["end_reason"] or {"중지됨": "cancelled", "시간 초과": "deadline"}.get(status)
+    rounds = max((call["round"] for call in run["usage_calls"]), default=0)
+    run.update(duration=duration, end_reason=end_reason, rounds=rounds)
+    record_generation_history(
+        run["generation_id"], final_user_prompt, run["events"], run["final"], status, rounds, duration, run["backend"],
+    )
+    get_usage_store().add({
+        "generation_id": run["generation_id"],
+        "backend": run["backend"],
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "duration": duration,
+        "rounds": rounds,
+        "passage_chars": len(run["final"]),
+        "end_reason": end_reason,
+        "calls": run["usage_calls"],
+    })
+    write_generation_log(
+        run["generation_id"], final_user_prompt, log_context, status, end_reason, rounds,
+        duration, run["final_elapsed"], run["usage_calls"], run["events"], run["final"], run["backend"],
+    )
+
+async def stream_and_render(final_user_prompt: str, selected_system_prompt: str, log_context: dict | None = None):
+    # 스트리밍 시작
+    st.session_state["is_streaming"] = True
+    try:
+        # 중지 버튼: 누르면 스크립트가 재실행되면서 진행 중인 렌더링의 다음 st 호출에서 중단됨
+        with stop_placeholder:
+            st.button("생성 중지", key="stop_generation", use_container_width=True)
+        
+        await render_generation(
+            new_generation_run("gemini"), final_user_prompt, selected_system_prompt, log_context,
+            reasoning_placeholder, final_placeholder, generation_status_placeholder,
+        )
+        stop_placeholder.empty()
     finally:
         # 스트리밍 종료
         st.session_state["is_streaming"] = False
 
+async def stream_and_compare(final_user_prompt: str, system_prompts: dict, log_context: dict | None = None):
+    """같은 사용자 프롬프트를 작가 모델 백엔드별로 동시에 실행해 나란히 표시하고, 끝나면 지표를 비교합니다.
+
+    system_prompts: 백엔드 → 그 백엔드에 보낼 시스템 프롬프트 (comparison_views와 같은 키)
+    """
+    st.session_state["is_streaming"] = True
+    comparison_id = uuid.uuid4().hex[:12]
+    runs = [new_generation_run(backend) for backend in system_prompts]
+    try:
+        with stop_placeholder:
+            st.button("생성 중지", key="stop_generation", use_container_width=True)
+        
+        # 전문가 질의는 두 흐름 모두 같은 경로(유사 질의 색인, 전문가 호출 제한기)를 거침
+        await asyncio.gather(*(
+            render_generation(
+                run, final_user_prompt, system_prompts[run["backend"]],
+                {**(log_context or {}), "comparison_id": comparison_id},
+                *comparison_views[run["backend"]],
+            )
+            for run in runs
+        ))
+        stop_placeholder.empty()
+    finally:
+        st.session_state["is_streaming"] = False
+    
+    st.session_state["last_comparison"] = [comparison_summary_row(run) for run in runs]
+
+def comparison_summary_row(run: dict) -> dict:
+    """비교 결과 표의 한 행 (백엔드별 지연 / 라운드 / 토큰)"""
+    writer_calls = [c for c in run["usage_calls"] if c.get("source") == "writer"]
+    return {
+        "모델": WRITER_BACKEND_LABELS[run["backend"]],
+        "상태": run["status"],
+        "소요(s)": round(run["duration"], 1),
+        "지문까지(s)": round(run["final_elapsed"], 1) if run["final_elapsed"] is not None else None,
+        "라운드": run["rounds"],
+        "전문가 호출": sum(1 for e in run["events"] if e.get("type") == "tool_output"),
+        "작가 지연(s)": round(sum(c.get("latency", 0.0) for c in writer_calls), 1),
+        "입력 토큰": sum(c.get("prompt_tokens", 0) for c in run["usage_calls"]),
+        "출력 토큰": sum(c.get("output_tokens", 0) for c in run["usage_calls"]),
+        "참고 비용($)": round(sum(estimate_cost(c) for c in run["usage_calls"]), 4),
+        "지문 길이": len(run["final"]),
+    }
+
+def render_last_comparison():
+    """가장 최근 비교 실행의 백엔드별 지표를 표시합니다."""
+    rows = st.session_state.get("last_comparison")
+    if not rows:
+        return
+    st.markdown("#### 모델 비교 결과")
+    st.dataframe(rows, hide_index=True)
+
+
 
 # render_event 함수 제거됨 - 새로운 3컬럼 렌더링 방식 사용
 
@@ -923,16 +1576,17 @@ async def stream_and_render(final_user_prompt: str, selected_system_prompt: str)
 if 'preset_run_button' in locals() and preset_run_button:
     if 'system_prompt' in locals() and 'user_prompt' in locals() and system_prompt and user_prompt:
         final_user_prompt = user_prompt  # 원본 프롬프트 사용
-        selected_system_prompt = system_prompt
+        # 작가 모델별로 학습한 시스템 프롬프트 사용 (샘플이 그 모델의 데이터셋이면 샘플의 것)
+        system_prompts = {backend: writer_system_prompt(backend, dataset_path, system_prompt) for backend in writer_backends}
         
-        # 입력 프롬프트 로깅
-        logger.info(f"=== Preset 지문 생성 시작 ===")
-        logger.info(f"입력 프롬프트:\n{final_user_prompt}")
-        logger.info(f"현재 시각: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info(f"Temperature: {st.session_state.get('temperature', 0.85)}")
+        # 생성 로그에 함께 기록할 입력 정보
+        log_context = {"mode": "preset", "dataset": os.path.basename(dataset_path), "dataset_index": dataset_index}
         
         # 스트리밍 함수 실행
-        asyncio.run(stream_and_render(final_user_prompt, selected_system_prompt))
+        if comparison_mode:
+            asyncio.run(stream_and_compare(final_user_prompt, system_prompts, log_context))
+        else:
+            asyncio.run(stream_and_render(final_user_prompt, system_prompts["gemini"], log_context))
     else:
         st.error("Preset 데이터를 로드할 수 없습니다.")
 
@@ -949,20 +1603,20 @@ if 'custom_run_button' in locals() and custom_run_button:
         
         final_user_prompt = format_prompt_from_components(custom_field_content, custom_type_content, custom_topic_content)
         
-        # 입력 프롬프트 로깅
-        logger.info(f"=== Custom 지문 생성 시작 ===")
-        logger.info(f"분야: {custom_field_content}")
-        logger.info(f"유형: {custom_type_content}")
-        logger.info(f"주제: {custom_topic_content}")
-        logger.info(f"입력 프롬프트:\n{final_user_prompt}")
-        logger.info(f"현재 시각: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info(f"Temperature: {st.session_state.get('temperature', 0.85)}")
+        # 생성 로그에 함께 기록할 입력 정보
+        log_context = {"mode": "custom"}
         
-        # 기본 시스템 프롬프트 사용 (첫 번째 샘플에서 추출)
-        default_system_prompt, _, _ = load_sample(0)
-        selected_system_prompt = default_system_prompt if default_system_prompt else ""
+        # 기본 시스템 프롬프트 사용 (작가 모델별 데이터셋의 첫 번째 샘플에서 추출)
+        system_prompts = {backend: writer_system_prompt(backend) for backend in writer_backends}
         
         # 스트리밍 함수 실행
-        asyncio.run(stream_and_render(final_user_prompt, selected_system_prompt))
+        if comparison_mode:
+            asyncio.run(stream_and_compare(final_user_prompt, system_prompts, log_context))
+        else:
+            asyncio.run(stream_and_render(final_user_prompt, system_prompts["gemini"], log_context))
     else:
         st.error("주제를 입력해주세요.")
+
+# 비교 결과와 생성 기록 (실행 로직 이후에 표시하여 방금 끝난 생성도 포함)
+render_last_comparison()
+render_generation_history()
@@ -0,0 +1,162 @@
+"""작가/전문가 모델 호출의 토큰 사용량 수집 및 집계.
+
+각 호출의 사용량(usage)은 아래 공통 형식으로 정규화됩니다.
+    {"prompt_tokens", "cached_tokens", "output_tokens", "total_tokens"}
+
+한 번의 지문 생성 기록(generation record)은 생성 ID, 작가 모델 백엔드(backend), 라운드 수,
+소요 시간과 호출별 사용량 목록(source, round, latency 포함)을 담으며, UsageStore가 최근 기록을
+보관하고 대시보드용 지표를 계산합니다.
+"""
+import threading
+from collections import Counter, deque
+
+# 100만 토큰당 참고 단가(USD). 실제 청구 단가가 바뀌면 여기만 수정합니다.
+TOKEN_PRICES_PER_MILLION = {
+    "writer": {"prompt": 0.30, "cached": 0.075, "output": 2.50},
+    "expert": {"prompt": 0.30, "cached": 0.075, "output": 2.50},
+}
+# 작가 모델 백엔드별 단가 (여기 없는 백엔드는 위의 writer 단가를 사용)
+WRITER_BACKEND_PRICES_PER_MILLION = {
+    "gpt": {"prompt": 3.00, "cached": 0.75, "output": 12.00},
+}
+DEFAULT_BACKEND = "gemini"
+
+
+def empty_usage() -> dict:
+    return {"prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+def usage_from_gemini(usage_metadata: dict | None) -> dict:
+    """Vertex/Gemini 응답의 usageMetadata를 공통 형식으로 변환합니다."""
+    usage = empty_usage()
+    if not usage_metadata:
+        return usage
+    usage["prompt_tokens"] = usage_metadata.get("promptTokenCount", 0)
+    usage["cached_tokens"] = usage_metadata.get("cachedContentTokenCount", 0)
+    # thinking 토큰도 출력 토큰으로 과금되므로 함께 합산
+    usage["output_tokens"] = usage_metadata.get("candidatesTokenCount", 0) + usage_metadata.get("thoughtsTokenCount", 0)
+    usage["total_tokens"] = usage_metadata.get("totalTokenCount", usage["prompt_tokens"] + usage["output_tokens"])
+    return usage
+
+
+def usage_from_openai(usage_obj) -> dict:
+    """OpenAI 호환 응답의 usage 객체를 공통 형식으로 변환합니다."""
+    usage = empty_usage()
+    if usage_obj is None:
+        return usage
+    usage["prompt_tokens"] = getattr(usage_obj, "prompt_tokens", 0) or 0
+    usage["output_tokens"] = getattr(usage_obj, "completion_tokens", 0) or 0
+    details = getattr(usage_obj, "prompt_tokens_details", None)
+    usage["cached_tokens"] = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    usage["total_tokens"] = getattr(usage_obj, "total_tokens", 0) or usage["prompt_tokens"] + usage["output_tokens"]
+    return usage
+
+
+def estimate_cost(call: dict) -> float:
+    """호출 하나의 참고 비용(USD)을 계산합니다. 캐시된 입력 토큰은 캐시 단가를 적용합니다."""
+    prices = TOKEN_PRICES_PER_MILLION.get(call.get("source"), TOKEN_PRICES_PER_MILLION["writer"])
+    if call.get("source") == "writer":
+        prices = WRITER_BACKEND_PRICES_PER_MILLION.get(call.get("backend"), prices)
+    cached = call.get("cached_tokens", 0)
+    uncached = max(0, call.get("prompt_tokens", 0) - cached)
+    return (uncached * prices["prompt"] + cached * prices["cached"] + call.get("output_tokens", 0) * prices["output"]) / 1_000_000
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class UsageStore:
+    """최근 지문 생성 기록을 보관하는 스레드 안전 저장소 (프로세스 전체에서 공유)"""
+
+    def __init__(self, maxlen: int = 500):
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> dict:
+        """대시보드 지표를 계산합니다."""
+        records = self.records()
+        calls = [call for record in records for call in record.get("calls", [])]
+
+        writer_calls = [c for c in calls if c.get("source") == "writer"]
+        expert_calls = [c for c in calls if c.get("source") == "expert"]
+        writer_latency = sum(c.get("latency", 0.0) for c in writer_calls)
+        writer_output = sum(c.get("output_tokens", 0) for c in writer_calls)
+
+        costs = {"writer": 0.0, "expert": 0.0}
+        for call in calls:
+            costs[call.get("source", "writer")] = costs.get(call.get("source", "writer"), 0.0) + estimate_cost(call)
+        total_cost = sum(costs.values())
+
+        completed = [r for r in records if r.get("passage_chars")]
+        tokens_per_passage = (
+            sum(c.get("total_tokens", 0) for r in completed for c in r.get("calls", [])) / len(completed)
+            if completed else 0.0
+        )
+
+        # 라운드별 소요 시간 / 토큰 (어떤 라운드가 지연과 비용을 지배하는지 확인용)
+        by_round = {}
+        for call in calls:
+            row = by_round.setdefault(call.get("round", 0), {"latency": 0.0, "total_tokens": 0, "calls": 0})
+            row["latency"] += call.get("latency", 0.0)
+            row["total_tokens"] += call.get("total_tokens", 0)
+            row["calls"] += 1
+
+        # 작가 모델 백엔드별 처리량 / 지연 / 라운드 / 비용 (비교 모드 결과 확인용)
+        by_backend = {}
+        for record in records:
+            by_backend.setdefault(record.get("backend", DEFAULT_BACKEND), []).append(record)
+
+        durations = [r.get("duration", 0.0) for r in records]
+        return {
+            "generations": len(records),
+            "completed": len(completed),
+            "writer_tokens_per_sec": writer_output / writer_latency if writer_latency else 0.0,
+            "tokens_per_passage": tokens_per_passage,
+            "prompt_tokens": sum(c.get("prompt_tokens", 0) for c in calls),
+            "cached_tokens": sum(c.get("cached_tokens", 0) for c in calls),
+            "output_tokens": sum(c.get("output_tokens", 0) for c in calls),
+            "writer_calls": len(writer_calls),
+            "expert_calls": len(expert_calls),
+            "estimated_cost": total_cost,
+            "expert_cost_share": costs.get("expert", 0.0) / total_cost if total_cost else 0.0,
+            "end_reasons": dict(Counter(r.get("end_reason") or "unknown" for r in records).most_common()),
+            "rounds_distribution": dict(sorted(Counter(r.get("rounds", 0) for r in records).items())),
+            "by_round": dict(sorted(by_round.items())),
+            "duration_p50": _percentile(durations, 0.5),
+            "duration_p95": _percentile(durations, 0.95),
+            "by_backend": {backend: summarize_backend(rows) for backend, rows in sorted(by_backend.items())},
+        }
+
+
+def summarize_backend(records: list[dict]) -> dict:
+    """한 작가 모델 백엔드의 생성 기록들을 요약합니다."""
+    calls = [call for record in records for call in record.get("calls", [])]
+    writer_calls = [c for c in calls if c.get("source") == "writer"]
+    writer_latency = sum(c.get("latency", 0.0) for c in writer_calls)
+    completed = [r for r in records if r.get("passage_chars")]
+    durations = [r.get("duration", 0.0) for r in records]
+    return {
+        "generations": len(records),
+        "completed": len(completed),
+        "avg_rounds": sum(r.get("rounds", 0) for r in records) / len(records) if records else 0.0,
+        "writer_tokens_per_sec": sum(c.get("output_tokens", 0) for c in writer_calls) / writer_latency if writer_latency else 0.0,
+        "tokens_per_passage": (
+            sum(c.get("total_tokens", 0) for r in completed for c in r.get("calls", [])) / len(completed)
+            if completed else 0.0
+        ),
+        "cost_per_generation": sum(estimate_cost(c) for c in calls) / len(records) if records else 0.0,
+        "duration_p50": _percentile(durations, 0.5),
+        "duration_p95": _percentile(durations, 0.95),
+    }